@@ -1,8 +1,32 @@
 #!/usr/bin/env python3
 
+import os
 import sys
 import struct
-from PIL import Image
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from rle.frames import FrameSource, peak_rss_mb
+from rle.pipeline import FramePipeline
+from rle.framerate import FrameRateConverter, DuplicateFilter
+from rle.quality import QualityLog
+from rle.quantize import MODES, quantize_grey
+from rle.spans import MERGE_ENGINES
+from rle.encoder import END_WORD, RepeatStats, RowCache, SnapSchedule, encode_frame, pack_words
+
+parser = argparse.ArgumentParser(description="RLE encode the Bad Apple frames")
+parser.add_argument("--quantize", choices=MODES, default="threshold", help="Grey level quantization mode")
+parser.add_argument("--merge", choices=MERGE_ENGINES, default="greedy", help="Span merge engine")
+parser.add_argument("--queue-depth", type=int, default=4, help="Frames to queue between the decode, encode and write stages, 0 to run them in sequence")
+parser.add_argument("--row-cache", type=int, default=4096, help="Number of rows to cache spans for, 0 to disable")
+parser.add_argument("--source-fps", type=float, default=30, help="Frame rate of the source frames")
+parser.add_argument("--fps", type=float, help="Output frame rate: 60, or 30 for playback with input 3 high.  Defaults to the source frame rate")
+parser.add_argument("--blend", action="store_true", help="Blend the source frames either side of each output frame instead of using the nearest")
+parser.add_argument("--dup", type=int, default=0, help="Reuse the previous frame's data if a frame differs from it in at most this many pixels, -1 to disable")
+parser.add_argument("--quality", metavar="CSV", help="Measure each frame against the source and write bytes, PSNR and SSIM per frame to CSV")
+parser.add_argument("--snap", type=int, default=0, help="Repeat the previous row if the row differs from it in at most this many pixels")
+parser.add_argument("--snap-schedule", metavar="FILE", help="Per frame snap tolerances, lines of \"frame tolerance\" each applying from that source frame on, --snap before the first")
+args = parser.parse_args()
 
 out_file = open("badapple640x480.bin", "wb")
 
@@ -43,107 +67,50 @@ colour_shift_changes = {
 
 max_span_len = 8
 data_len = 0
-colour_shift = TWO
-
-for i in range(1,6957):
-    img = Image.open("frames/badapple%04d.png" % (i,)).resize((640,480))
-
-    data = img.load()
-    last_spans = []
-    repeat_count = 0
-
-    if i in colour_shift_changes.keys():
-        colour_shift = colour_shift_changes[i]
-
-    for y in range(0,480):
-        spans = []
-        span_len = 0
-        span_colour = 0
-        for x in range(640):
-            if colour_shift == FOUR:
-                if data[x, y][0] > 170: colour =   0b111111
-                elif data[x, y][0] > 100: colour = 0b101010
-                elif data[x, y][0] > 45: colour =  0b010101
-                else: colour = 0
-            else:
-                if data[x, y][0] > 100: colour =   0b111111
-                else: colour = 0
-
-            if colour != span_colour:
-                if span_len > 1:
-                    spans.append([span_len, span_colour])
-                    span_len = 0
-                span_colour = colour
-
-            span_len += 1
-
-        if span_len > 1:
-            spans.append([span_len, span_colour])
-        else:
-            spans[-1][0] += 1
-
-        if len(spans) > 3:
-            while True:
-                shortest_spans = 640
-                shortest_idx = 0
-                for idx, s in enumerate(spans[1:-1]):
-                    slen = s[0] + spans[idx][0] + spans[idx+2][0]
-
-                    if slen < shortest_spans:
-                        shortest_idx = idx + 1
-                        shortest_spans = slen
-            
-                if shortest_spans >= 3 * max_span_len:
-                    break
-
-                shortest_span, idx = min((a, i) for (i, a) in enumerate([s[0] for s in spans[shortest_idx-1:shortest_idx+2]]))
-                shortest_idx += idx - 1
-
-                #print(shortest_span, shortest_idx, spans)
-                if shortest_idx == 0: 
-                    spans[1][0] += shortest_span
-                    del spans[0]
-                elif shortest_idx == len(spans) - 1: 
-                    spans[-2][0] += shortest_span
-                    del spans[-1]
-                else:
-                    if spans[shortest_idx-1][0] < spans[shortest_idx+1][0]:
-                        spans[shortest_idx-1][0] += shortest_span
-                        del spans[shortest_idx]
-                    else:
-                        spans[shortest_idx+1][0] += shortest_span
-                        del spans[shortest_idx]
-                    if spans[shortest_idx][1] == spans[shortest_idx-1][1]:
-                        spans[shortest_idx-1][0] += spans[shortest_idx][0]
-                        del spans[shortest_idx]
-
-                if sum([s[0] for s in spans]) != 640:
-                    #print(spans)
-                    print("Error")
-                    sys.exit(0)
-
-                if len(spans) <= 3:
-                    break
-
-        if spans == last_spans:
-            repeat_count += 1
+cache = RowCache(args.row_cache, args.merge, max_span_len) if args.row_cache else None
+repeat_stats = RepeatStats()
+converter = FrameRateConverter(range(1,6957), args.source_fps, args.fps, args.blend)
+duplicates = DuplicateFilter(args.dup)
+quality = QualityLog(args.quality) if args.quality else None
+snaps = SnapSchedule.load(args.snap_schedule, args.snap) if args.snap_schedule else SnapSchedule(args.snap)
+pipeline = FramePipeline(FrameSource("frames/badapple%04d.png", converter.source_indexes, channel=0), out_file, args.queue_depth)
+frame = 0
+for i, source_pixels in pipeline:
+    data = b""
+    for j, pixels in converter.push(i, source_pixels):
+        colour_shift = colour_shift_changes[max(k for k in colour_shift_changes if k <= j)]
+
+        colours = quantize_grey(pixels, colour_shift, args.quantize, max_span_len)
+        if duplicates.is_duplicate(colours):
+            data += frame_data
+            print("Frame %d (source %d), duplicate" % (frame, j))
         else:
-            if repeat_count != 0:
-                out_file.write(struct.pack('>H', 0xf800 + repeat_count))
-                data_len += 2
-            repeat_count = 0
-            for span in spans:
-                out_file.write(struct.pack('>H', (span[0] << 6) + span[1]))
-            data_len += 2 * len(spans)
-            last_spans = spans
-
-    if repeat_count != 0:
-        out_file.write(struct.pack('>H', 0xf800 + repeat_count))
-        data_len += 2
-    print("Frame %d, len %.2fMB" % (i, data_len / (1024 * 1024)))
+            frame_stats = RepeatStats()
+            words = encode_frame(colours, args.merge, max_span_len, cache, snaps.tolerance(j), frame_stats)
+            repeat_stats.add(frame_stats)
+            frame_data = pack_words(words)
+            data += frame_data
+            print("Frame %d (source %d), len %.2fMB, %s" % (frame, j, (data_len + len(data)) / (1024 * 1024), frame_stats.summary()))
+        if quality is not None:
+            print("  PSNR %.2fdB, SSIM %.4f" % quality.add(frame, j, words, pixels))
+        frame += 1
+
+    pipeline.write(data)
+    data_len += len(data)
 
     if data_len > 16 * 1024 * 1024 - 32 * 1024:
         print("Terminating early")
         break
 
-out_file.write(struct.pack('>H', (0x3ff << 6)))
\ No newline at end of file
+pipeline.close()
+out_file.write(struct.pack('>H', END_WORD))
+
+print(pipeline.stats())
+print("%d output frames at %sfps, %d duplicates reused" % (frame, args.fps or args.source_fps, duplicates.duplicates))
+if quality is not None:
+    quality.close()
+    print(quality.summary())
+print("Row repeats: " + repeat_stats.summary())
+if cache is not None:
+    print(cache.stats())
+print("Peak RSS %.0fMB" % (peak_rss_mb(),))
\ No newline at end of file
@@ -1,3 +1,4 @@
 #!/bin/bash
 
-mpremote connect /dev/ttyACM0 + mount . + exec "import os; os.chdir('/'); import flash_prog; flash_prog.program('/remote/badapple640x480.bin')"
+# Needs usb_transfer.py on the device along with the other micropython files
+cd "$(dirname "$0")/.." && python3 -m rle.upload badapple/badapple640x480.bin --port /dev/ttyACM0
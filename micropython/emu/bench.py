@@ -0,0 +1,229 @@
+# SPDX-FileCopyrightText: © 2024 Michael Bell
+# SPDX-License-Identifier: MIT
+
+# Benchmarks for the device code, run on the host against the emulated
+# machine and rp2 modules and the models of the flash and the VGA output.
+#
+#   python3 micropython/emu/bench.py [tt_flash] [ice_flash] [selftest] [--size 65536] [--frames 2]
+#
+# Each benchmark runs the device code unchanged and checks the result: the
+# flash contents against the image, or a PASS from the self-test.  Reported
+# are the wall time and throughput under emulation, the bus time the same
+# transfers take on the device (PIO cycles and SPI clocks at their
+# configured rates), the calls into the state machines per byte, the time
+# the flash spent busy, and the garbage collections during the run.  With
+# --tracemalloc the peak Python heap is reported too, which includes the
+# emulator's own allocations.
+#
+# Wall times measure CPython running the emulator, not the RP2040: use them
+# to compare versions of the device code with each other, and the bus time
+# and call counts to see where the device spends its time.
+
+import io
+import os
+import gc
+import sys
+import time
+import zlib
+import random
+import argparse
+import tempfile
+import tracemalloc
+import contextlib
+
+import board
+board.install()
+sys.path.insert(0, os.path.dirname(board.DEVICE_DIR))
+
+from board import gpio, stats
+from w25q import W25Q128
+
+ICE_DIR = os.path.join(os.path.dirname(board.DEVICE_DIR), "pico_ice", "micropython")
+
+# TT demo board flash on the QSPI Pmod: cs, mosi, miso, sck on uio[0:4]
+TT_FLASH_PINS = (21, 24, 22, 23)
+# pico-ice flash, used by flash_prog.py
+ICE_FLASH_PINS = (1, 2, 3, 0)
+
+
+class Result:
+    def __init__(self, name, nbytes, unit="bytes"):
+        self.name = name
+        self.nbytes = nbytes
+        self.unit = unit
+        self.wall = 0.0
+        self.collections = 0
+        self.peak = None
+        self.flash = None
+        self.clocks = None
+
+
+@contextlib.contextmanager
+def measure(result, trace):
+    collections = [0]
+
+    def count(phase, info):
+        if phase == "start":
+            collections[0] += 1
+
+    gc.collect()
+    gc.callbacks.append(count)
+    if trace:
+        tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        result.wall = time.perf_counter() - start
+        if trace:
+            result.peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        gc.callbacks.remove(count)
+        result.collections = collections[0]
+
+
+def _reset():
+    gpio.reset()
+    stats.reset()
+
+
+def _image(size, seed):
+    rng = random.Random(seed)
+    return bytes(rng.getrandbits(8) for _ in range(size))
+
+
+def _check_flash(flash, data):
+    if flash.data[:len(data)] != data:
+        bad = next(i for i in range(len(data)) if flash.data[i] != data[i])
+        raise Exception("Flash differs from the image at %06x" % (bad,))
+
+
+def bench_tt_flash(filename, data, args, out):
+    """flash_prog.program on the TT demo board, through the PIO SPI"""
+    _reset()
+    flash = W25Q128(*TT_FLASH_PINS, time_scale=args.time_scale)
+    with contextlib.redirect_stdout(out):
+        board.load("ttcontrol")
+        flash_prog = board.load("flash_prog")
+    result = Result("tt_flash", len(data))
+    stats.reset()
+    with contextlib.redirect_stdout(out), measure(result, args.tracemalloc):
+        flash_prog.program(filename)
+    _check_flash(flash, data)
+    result.flash = flash
+    return result
+
+
+def bench_ice_flash(filename, data, args, out):
+    """flash_prog.program on the pico-ice, through hardware SPI"""
+    _reset()
+    flash = W25Q128(*ICE_FLASH_PINS, time_scale=args.time_scale)
+    flash_prog = board.load("ice_flash_prog", os.path.join(ICE_DIR, "flash_prog.py"))
+    result = Result("ice_flash", len(data))
+    stats.reset()
+    with contextlib.redirect_stdout(out), measure(result, args.tracemalloc):
+        flash_prog.program(filename)
+    _check_flash(flash, data)
+    result.flash = flash
+    return result
+
+
+def _test_frames(count, seed):
+    import numpy as np
+    from rle.decoder import HEIGHT, WIDTH
+
+    # Bands of colour that move from frame to frame, with noise in some rows
+    rng = np.random.default_rng(seed)
+    frames = []
+    for n in range(count):
+        y, x = np.mgrid[0:HEIGHT, 0:WIDTH]
+        frame = ((x // 40 + y // 30 + n) % 64).astype(np.uint8)
+        rows = rng.choice(HEIGHT, 16, replace=False)
+        frame[rows] = rng.integers(0, 64, (16, WIDTH), dtype=np.uint8)
+        frames.append(frame)
+    return frames
+
+
+def bench_selftest(crc_file, frames, args, out):
+    """vga_selftest.selftest, clocking the VGA model from the PIO capture"""
+    import numpy as np
+    from rle.selftest import capture_words, frame_crcs
+    from vga import VGASource
+
+    ui = 0b0001
+    words = capture_words(ui)
+    with open(crc_file, "wb") as f:
+        f.write(np.concatenate([frame_crcs(frame, words) for frame in frames]).tobytes())
+
+    _reset()
+    vga = VGASource(frames)
+    with contextlib.redirect_stdout(out):
+        board.load("ttcontrol")
+        vga_selftest = board.load("vga_selftest")
+    result = Result("selftest", len(frames) * vga_selftest.HEIGHT * vga_selftest.WIDTH, "pixels")
+    stats.reset()
+    with contextlib.redirect_stdout(out), measure(result, args.tracemalloc):
+        mismatches = vga_selftest.selftest(crc_file, ui=ui)
+    if mismatches:
+        raise Exception("Self-test found %d mismatched rows" % (mismatches,))
+    result.clocks = vga.clocks
+    return result
+
+
+def report(result):
+    s = stats
+    unit = result.unit
+    print("%s: %d %s in %.2fs, %.0f %s/s emulated" % (result.name, result.nbytes, unit, result.wall, result.nbytes / result.wall, unit))
+    if s.bus_time:
+        print("  bus time %.1fms, %.0f %s/s on the device bus" % (s.bus_time * 1000, result.nbytes / s.bus_time, unit))
+    print("  %.2f puts and %.2f gets per %s, %d SPI bytes, %d DMA words, %.1fms of sleeps" % (
+        s.sm_put / result.nbytes, s.sm_get / result.nbytes, unit[:-1], s.spi_bytes, s.dma_words, s.sleep_us / 1000))
+    if result.flash is not None:
+        f = result.flash
+        print("  flash: %d pages, %d erases, %.1fms busy, %d status reads" % (f.pages, f.erases, f.busy_time * 1000, f.status_reads))
+    if result.clocks is not None:
+        print("  %d design clocks" % (result.clocks,))
+    line = "  %d gc collections" % (result.collections,)
+    if result.peak is not None:
+        line += ", %.1fkB peak heap" % (result.peak / 1024,)
+    print(line)
+
+
+def main():
+    benches = ("tt_flash", "ice_flash", "selftest")
+    parser = argparse.ArgumentParser(description="Benchmark the device code under emulation")
+    parser.add_argument("bench", nargs="*", help="Benchmarks to run, from %s, default all" % (", ".join(benches),))
+    parser.add_argument("--size", type=int, default=65536, help="Bytes to program")
+    parser.add_argument("--frames", type=int, default=2, help="Frames to check in the self-test")
+    parser.add_argument("--time-scale", type=float, default=1.0, help="Scale the flash busy times")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--tracemalloc", action="store_true", help="Also report the peak heap, slower")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Show the device output")
+    args = parser.parse_args()
+    for name in args.bench:
+        if name not in benches:
+            parser.error("unknown benchmark %s, choose from %s" % (name, ", ".join(benches)))
+    if not args.bench:
+        args.bench = benches
+
+    out = sys.stdout if args.verbose else io.StringIO()
+    data = _image(args.size, args.seed)
+    with tempfile.TemporaryDirectory() as tmp:
+        image = os.path.join(tmp, "image.bin")
+        with open(image, "wb") as f:
+            f.write(data)
+        print("Image %d bytes, crc %08x" % (len(data), zlib.crc32(data)))
+
+        for name in args.bench:
+            if name == "tt_flash":
+                result = bench_tt_flash(image, data, args, out)
+            elif name == "ice_flash":
+                result = bench_ice_flash(image, data, args, out)
+            else:
+                frames = _test_frames(args.frames, args.seed)
+                result = bench_selftest(os.path.join(tmp, "selftest.crc"), frames, args, out)
+            report(result)
+
+
+if __name__ == "__main__":
+    main()
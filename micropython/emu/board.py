@@ -0,0 +1,141 @@
+# SPDX-FileCopyrightText: © 2024 Michael Bell
+# SPDX-License-Identifier: MIT
+
+# GPIO state shared by the emulated machine and rp2 modules, and the devices
+# wired to it.
+#
+# Each GPIO has one level.  Whoever last wrote it wins, whether that is the
+# Python code through machine.Pin, a PIO state machine or a device model.
+# Devices register listeners that are called when a pin's level changes, which
+# is how the flash model sees SPI clock edges from a PIO program.
+#
+# install() puts this directory and micropython/ on sys.path, so device code
+# imports the emulated machine, rp2 and micropython modules unchanged, and adds
+# the MicroPython ticks and sleep functions to the time module.  Device modules
+# are then loaded with load(), which gives them MicroPython's sys.version.
+
+import os
+import sys
+import time
+import builtins
+import importlib.util
+
+NUM_GPIOS = 30
+
+EMU_DIR = os.path.dirname(os.path.abspath(__file__))
+DEVICE_DIR = os.path.dirname(EMU_DIR)
+
+
+class GPIO:
+    def __init__(self):
+        self.levels = [0] * NUM_GPIOS
+        self.listeners = [[] for _ in range(NUM_GPIOS)]
+        # Pins driven by a device model, which pulls don't override
+        self.driven = set()
+        # Devices on each hardware SPI clock pin
+        self.spi_devices = {}
+        self.writes = 0
+
+    def get(self, pin):
+        return self.levels[pin]
+
+    def set(self, pin, level):
+        old = self.levels[pin]
+        if old == level:
+            return
+        self.levels[pin] = level
+        self.writes += 1
+        for listener in self.listeners[pin]:
+            listener(pin, level)
+
+    def listen(self, pin, listener):
+        self.listeners[pin].append(listener)
+
+    def pull(self, pin, level):
+        if pin not in self.driven:
+            self.set(pin, level)
+
+    def reset(self):
+        self.__init__()
+
+
+gpio = GPIO()
+
+
+class Stats:
+    """Counts of the calls into the emulated hardware, for the benchmarks"""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.sm_put = 0
+        self.sm_get = 0
+        self.bus_time = 0.0      # seconds of PIO cycles and SPI clocks at their rates
+        self.spi_bytes = 0
+        self.dma_words = 0
+        self.sleep_us = 0
+
+
+stats = Stats()
+
+
+def _ticks_us():
+    return int(time.perf_counter() * 1_000_000) & 0x3FFFFFFF
+
+
+def _ticks_ms():
+    return int(time.perf_counter() * 1000) & 0x3FFFFFFF
+
+
+def _ticks_diff(a, b):
+    d = (a - b) & 0x3FFFFFFF
+    return d - 0x40000000 if d & 0x20000000 else d
+
+
+def _sleep_us(us):
+    stats.sleep_us += us
+    if us > 0:
+        time.sleep(us / 1_000_000)
+
+
+def _sleep_ms(ms):
+    _sleep_us(ms * 1000)
+
+
+def install():
+    """Make the emulated modules importable in place of MicroPython's"""
+    for path in (DEVICE_DIR, EMU_DIR):
+        if path not in sys.path:
+            sys.path.insert(0, path)
+    time.ticks_us = _ticks_us
+    time.ticks_ms = _ticks_ms
+    time.ticks_diff = _ticks_diff
+    time.ticks_add = lambda a, b: (a + b) & 0x3FFFFFFF
+    time.sleep_us = _sleep_us
+    time.sleep_ms = _sleep_ms
+    # MicroPython compiles @micropython.native without an import
+    import micropython
+    builtins.micropython = micropython
+
+
+def load(name, path=None):
+    """Import the device module name, from path if given, as a fresh module.
+
+    ttcontrol.py reads the firmware version from sys.version at import, so it
+    looks like MicroPython's while the module runs."""
+    if path is None:
+        path = os.path.join(DEVICE_DIR, name + ".py")
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    version = sys.version
+    sys.version = "3.4.0; MicroPython emulated on CPython " + version.split()[0]
+    sys.modules[name] = module
+    try:
+        spec.loader.exec_module(module)
+    except BaseException:
+        del sys.modules[name]
+        raise
+    finally:
+        sys.version = version
+    return module
@@ -0,0 +1,132 @@
+# SPDX-FileCopyrightText: © 2024 Michael Bell
+# SPDX-License-Identifier: MIT
+
+# Stand-in for the MicroPython machine module on the RP2040, backed by the
+# GPIO model in board.py.  Hardware and soft SPI transfer whole bytes with the
+# devices attached to their clock pin, without modelling each clock edge.
+
+from board import gpio, stats
+
+_freq = 125_000_000
+
+
+def freq(hz=None):
+    global _freq
+    if hz is None:
+        return _freq
+    _freq = hz
+
+
+def _pin_id(pin):
+    return pin.id if isinstance(pin, Pin) else pin
+
+
+class Pin:
+    IN = 0
+    OUT = 1
+    OPEN_DRAIN = 2
+    ALT = 3
+    PULL_UP = 1
+    PULL_DOWN = 2
+
+    def __init__(self, id, mode=-1, pull=-1, value=None, **kwargs):
+        self.id = _pin_id(id)
+        self.mode = self.IN
+        self.init(mode, pull, value)
+
+    def init(self, mode=-1, pull=-1, value=None, **kwargs):
+        if mode != -1:
+            self.mode = mode
+        if value is not None:
+            self.value(value)
+        if self.mode == self.IN and pull in (self.PULL_UP, self.PULL_DOWN):
+            gpio.pull(self.id, 1 if pull == self.PULL_UP else 0)
+
+    def value(self, v=None):
+        if v is None:
+            return gpio.get(self.id)
+        gpio.set(self.id, 1 if v else 0)
+
+    __call__ = value
+
+    def on(self):
+        gpio.set(self.id, 1)
+
+    def off(self):
+        gpio.set(self.id, 0)
+
+    def high(self):
+        self.on()
+
+    def low(self):
+        self.off()
+
+    def toggle(self):
+        gpio.set(self.id, 1 - gpio.get(self.id))
+
+
+class PWM:
+    def __init__(self, pin, freq=0, duty_u16=0):
+        self.pin = _pin_id(pin)
+        self._freq = freq
+        self._duty = duty_u16
+
+    def freq(self, f=None):
+        if f is None:
+            return self._freq
+        self._freq = f
+
+    def duty_u16(self, d=None):
+        if d is None:
+            return self._duty
+        self._duty = d
+
+    def deinit(self):
+        pass
+
+
+class SPI:
+    MSB = 0
+    LSB = 1
+
+    def __init__(self, id=0, baudrate=1_000_000, polarity=0, phase=0, bits=8, firstbit=MSB,
+                 sck=None, mosi=None, miso=None):
+        self.baudrate = baudrate
+        self.sck = _pin_id(sck) if sck is not None else None
+        self.mosi = _pin_id(mosi) if mosi is not None else None
+        self.miso = _pin_id(miso) if miso is not None else None
+
+    def init(self, baudrate=None, **kwargs):
+        if baudrate is not None:
+            self.baudrate = baudrate
+
+    def deinit(self):
+        pass
+
+    def _exchange(self, out):
+        stats.spi_bytes += len(out)
+        stats.bus_time += len(out) * 8 / self.baudrate
+        result = bytearray(len(out))
+        for device in gpio.spi_devices.get(self.sck, ()):
+            if device.selected and device.mosi == self.mosi:
+                for i, b in enumerate(out):
+                    r = device.transfer(b)
+                    if device.miso == self.miso:
+                        result[i] = r
+        return result
+
+    def write(self, buf):
+        self._exchange(bytes(buf))
+
+    def read(self, n, write=0):
+        return bytes(self._exchange(bytes([write]) * n))
+
+    def readinto(self, buf, write=0):
+        buf[:] = self._exchange(bytes([write]) * len(buf))
+
+    def write_readinto(self, write_buf, read_buf):
+        read_buf[:] = self._exchange(bytes(write_buf))
+
+
+class SoftSPI(SPI):
+    pass
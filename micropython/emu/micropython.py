@@ -0,0 +1,21 @@
+# SPDX-FileCopyrightText: © 2024 Michael Bell
+# SPDX-License-Identifier: MIT
+
+# Stand-in for the MicroPython micropython module.  The code emitters are
+# no-ops, so native and viper functions run as plain Python.
+
+
+def native(f):
+    return f
+
+
+def viper(f):
+    return f
+
+
+def const(x):
+    return x
+
+
+def kbd_intr(c):
+    pass
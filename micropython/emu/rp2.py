@@ -0,0 +1,452 @@
+# SPDX-FileCopyrightText: © 2024 Michael Bell
+# SPDX-License-Identifier: MIT
+
+# Stand-in for the MicroPython rp2 module: an interpreter for PIO programs,
+# and DMA from a state machine's RX FIFO.
+#
+# There is no concurrency: a state machine runs only when the Python code
+# interacts with it, by put, get, exec, active or a DMA transfer, and then runs
+# until it stalls, or for MAX_STEPS instructions if it never does, as for a
+# free running clock.  A get that could never complete raises instead of
+# hanging.
+# Side-set is applied when an instruction starts, even if it then stalls, and
+# in_ samples its pins before its own side-set, as the hardware does.  Each
+# executed instruction and delay counts one cycle at the state machine's
+# frequency towards board.stats.bus_time.
+#
+# Supported: nop, out, in_, pull, push, set, mov, jmp and wait on gpio or pin,
+# with labels, wrap, autopull and autopush.  irq is not.
+
+import types
+from collections import deque
+
+from board import gpio, stats
+
+MAX_STEPS = 1_000_000
+
+
+class PIO:
+    IN_LOW = 0
+    IN_HIGH = 1
+    OUT_LOW = 2
+    OUT_HIGH = 3
+    SHIFT_LEFT = 0
+    SHIFT_RIGHT = 1
+    JOIN_NONE = 0
+    JOIN_TX = 1
+    JOIN_RX = 2
+    IRQ_SM0 = 0x100
+
+    def __init__(self, id):
+        self.id = id
+
+    def state_machine(self, id, *args, **kwargs):
+        return StateMachine(self.id * 4 + id, *args, **kwargs)
+
+    def remove_program(self, program=None):
+        pass
+
+
+class Instr:
+    def __init__(self, op, *args):
+        self.op = op
+        self.args = args
+        self.side_value = None
+        self.delay_cycles = 0
+
+    def side(self, value):
+        self.side_value = value
+        return self
+
+    def delay(self, cycles):
+        self.delay_cycles = cycles
+        return self
+
+    def __getitem__(self, cycles):
+        return self.delay(cycles)
+
+
+class Program:
+    def __init__(self, name, config):
+        self.name = name
+        self.config = config
+        self.instrs = []
+        self.labels = {}
+        self.wrap_target = 0
+        self.wrap = None
+
+
+def _builders(program):
+    def emit(op):
+        def build(*args):
+            instr = Instr(op, *args)
+            program.instrs.append(instr)
+            return instr
+        return build
+
+    def label(name):
+        program.labels[name] = len(program.instrs)
+
+    def wrap_target():
+        program.wrap_target = len(program.instrs)
+
+    def wrap():
+        program.wrap = len(program.instrs) - 1
+
+    names = {op: emit(op) for op in ("nop", "out", "in_", "pull", "push", "set", "mov", "jmp", "wait", "irq", "word")}
+    names.update(label=label, wrap_target=wrap_target, wrap=wrap)
+    for symbol in ("pins", "x", "y", "osr", "isr", "null", "pindirs", "pc", "status", "gpio", "pin",
+                   "block", "noblock", "ifempty", "iffull", "x_dec", "y_dec", "not_x", "not_y",
+                   "x_not_y", "not_osre"):
+        names[symbol] = symbol
+    return names
+
+
+def asm_pio(**config):
+    def assemble(f):
+        program = Program(f.__name__, config)
+        namespace = dict(f.__globals__)
+        namespace.update(_builders(program))
+        types.FunctionType(f.__code__, namespace)()
+        if program.wrap is None:
+            program.wrap = len(program.instrs) - 1
+        return program
+    return assemble
+
+
+def _pin_count(init):
+    if init is None:
+        return 0
+    return len(init) if isinstance(init, (tuple, list)) else 1
+
+
+def _pin_id(pin):
+    return getattr(pin, "id", pin)
+
+
+_state_machines = {}
+
+
+class StateMachine:
+    def __init__(self, id, program=None, freq=125_000_000, **kwargs):
+        self.id = id
+        _state_machines[id] = self
+        self.program = None
+        self._active = False
+        if program is not None:
+            self.init(program, freq, **kwargs)
+
+    def init(self, program, freq=125_000_000, in_base=None, out_base=None, set_base=None,
+             sideset_base=None, jmp_pin=None, **kwargs):
+        self.program = program
+        self.freq = freq
+        config = dict(program.config)
+        config.update(kwargs)
+        self.in_base = _pin_id(in_base)
+        self.out_base = _pin_id(out_base)
+        self.set_base = _pin_id(set_base)
+        self.sideset_base = _pin_id(sideset_base)
+        self.jmp_pin = _pin_id(jmp_pin)
+        self.out_count = _pin_count(config.get("out_init"))
+        self.set_count = _pin_count(config.get("set_init"))
+        self.sideset_count = _pin_count(config.get("sideset_init"))
+        self.out_left = config.get("out_shiftdir", PIO.SHIFT_LEFT) == PIO.SHIFT_LEFT
+        self.in_left = config.get("in_shiftdir", PIO.SHIFT_LEFT) == PIO.SHIFT_LEFT
+        self.autopull = config.get("autopull", False)
+        self.autopush = config.get("autopush", False)
+        self.pull_thresh = config.get("pull_thresh", 32)
+        self.push_thresh = config.get("push_thresh", 32)
+        join = config.get("fifo_join", PIO.JOIN_NONE)
+        self.tx_depth = 8 if join == PIO.JOIN_TX else (0 if join == PIO.JOIN_RX else 4)
+        self.rx_depth = 8 if join == PIO.JOIN_RX else (0 if join == PIO.JOIN_TX else 4)
+        self.restart()
+
+    def restart(self):
+        self.pc = 0
+        self.x = 0
+        self.y = 0
+        self.osr = 0
+        self.osr_count = 32
+        self.isr = 0
+        self.isr_count = 0
+        self.tx = deque()
+        self.rx = deque()
+
+    def active(self, value=None):
+        if value is None:
+            return self._active
+        self._active = bool(value)
+        if self._active:
+            self._run()
+
+    def put(self, value, shift=0):
+        stats.sm_put += 1
+        values = value if isinstance(value, (bytes, bytearray, list, tuple)) else (value,)
+        for v in values:
+            if len(self.tx) >= self.tx_depth:
+                self._run(lambda: len(self.tx) < self.tx_depth)
+                if len(self.tx) >= self.tx_depth:
+                    raise RuntimeError("%s: put would block forever" % (self.program.name,))
+            self.tx.append((v << shift) & 0xFFFFFFFF)
+        self._run()
+
+    def get(self, buf=None, shift=0):
+        stats.sm_get += 1
+        word = self._get_word()
+        if buf is None:
+            return word >> shift
+        for i in range(len(buf)):
+            buf[i] = (word if i == 0 else self._get_word()) >> shift
+
+    def _get_word(self):
+        if not self.rx:
+            self._run(lambda: len(self.rx) > 0)
+            if not self.rx:
+                raise RuntimeError("%s: get would block forever" % (self.program.name,))
+        word = self.rx.popleft()
+        self._run()
+        return word
+
+    def rx_fifo(self):
+        return len(self.rx)
+
+    def tx_fifo(self):
+        return len(self.tx)
+
+    def exec(self, instr):
+        program = Program("exec", {})
+        instr = eval(instr, _builders(program))
+        if self._step(instr, True) is None:
+            raise RuntimeError("exec of a stalling instruction is not supported")
+        self._run()
+
+    def irq(self, handler=None, trigger=0, hard=False):
+        pass
+
+    def _run(self, done=None):
+        if not self._active or self.program is None:
+            return
+        instrs = self.program.instrs
+        for _ in range(MAX_STEPS):
+            if done is not None and done():
+                return
+            if self._step(instrs[self.pc]) is None:
+                return
+
+    # Pins
+
+    def _write_pins(self, base, count, value):
+        for i in range(count):
+            gpio.set((base + i) % 32, (value >> i) & 1)
+
+    def _read_pins(self, count):
+        value = 0
+        for i in range(count):
+            value |= gpio.get((self.in_base + i) % 32) << i
+        return value
+
+    def _source(self, src, bits=32):
+        if src == "pins":
+            return self._read_pins(bits)
+        if src == "x":
+            return self.x
+        if src == "y":
+            return self.y
+        if src == "osr":
+            return self.osr
+        if src == "isr":
+            return self.isr
+        if src == "null":
+            return 0
+        if src == "status":
+            return 0xFFFFFFFF if not self.tx else 0
+        if isinstance(src, int):
+            return src
+        raise NotImplementedError("PIO source %s" % (src,))
+
+    def _dest(self, dest, value, bits):
+        if dest == "pins":
+            self._write_pins(self.out_base, bits, value)
+        elif dest == "x":
+            self.x = value
+        elif dest == "y":
+            self.y = value
+        elif dest == "osr":
+            self.osr = value
+            self.osr_count = 0
+        elif dest == "isr":
+            self.isr = value
+            self.isr_count = 0
+        elif dest == "pc":
+            self.pc = value
+            return True
+        elif dest in ("null", "pindirs"):
+            pass
+        else:
+            raise NotImplementedError("PIO destination %s" % (dest,))
+        return False
+
+    # Execution
+
+    def _step(self, instr, exec=False):
+        """Execute instr.  Returns None if it stalled, else True"""
+        op = instr.op
+        args = instr.args
+        sample = None
+        if op == "in_" and args[0] == "pins":
+            sample = self._read_pins(args[1])
+        if instr.side_value is not None:
+            self._write_pins(self.sideset_base, self.sideset_count, instr.side_value)
+
+        jumped = False
+        if op == "nop":
+            pass
+        elif op == "out":
+            dest, bits = args
+            if self.autopull and self.osr_count >= self.pull_thresh:
+                if not self.tx:
+                    return None
+                self.osr = self.tx.popleft()
+                self.osr_count = 0
+            mask = (1 << bits) - 1 if bits < 32 else 0xFFFFFFFF
+            if self.out_left:
+                value = (self.osr >> (32 - bits)) & mask
+                self.osr = (self.osr << bits) & 0xFFFFFFFF
+            else:
+                value = self.osr & mask
+                self.osr >>= bits
+            self.osr_count += bits
+            jumped = self._dest(dest, value, bits)
+        elif op == "in_":
+            src, bits = args
+            value = sample if sample is not None else self._source(src)
+            value &= (1 << bits) - 1 if bits < 32 else 0xFFFFFFFF
+            if self.in_left:
+                isr = ((self.isr << bits) | value) & 0xFFFFFFFF
+            else:
+                isr = (self.isr >> bits) | (value << (32 - bits)) if bits < 32 else value
+            count = self.isr_count + bits
+            if self.autopush and count >= self.push_thresh:
+                if len(self.rx) >= self.rx_depth:
+                    return None
+                self.rx.append(isr)
+                isr = 0
+                count = 0
+            self.isr = isr
+            self.isr_count = count
+        elif op == "pull":
+            ifempty = "ifempty" in args
+            block = "noblock" not in args
+            if not (ifempty and self.osr_count < self.pull_thresh):
+                if self.tx:
+                    self.osr = self.tx.popleft()
+                    self.osr_count = 0
+                elif block:
+                    return None
+                else:
+                    self.osr = self.x
+                    self.osr_count = 0
+        elif op == "push":
+            iffull = "iffull" in args
+            block = "noblock" not in args
+            if not (iffull and self.isr_count < self.push_thresh):
+                if len(self.rx) < self.rx_depth:
+                    self.rx.append(self.isr)
+                elif block:
+                    return None
+                self.isr = 0
+                self.isr_count = 0
+        elif op == "set":
+            dest, value = args
+            if dest == "pins":
+                self._write_pins(self.set_base, self.set_count, value)
+            else:
+                self._dest(dest, value, 5)
+        elif op == "mov":
+            dest, src = args
+            jumped = self._dest(dest, self._source(src), 32)
+        elif op == "jmp":
+            cond, target = (None, args[0]) if len(args) == 1 else args
+            if cond is None:
+                take = True
+            elif cond == "not_x":
+                take = self.x == 0
+            elif cond == "x_dec":
+                take = self.x != 0
+                self.x = (self.x - 1) & 0xFFFFFFFF
+            elif cond == "not_y":
+                take = self.y == 0
+            elif cond == "y_dec":
+                take = self.y != 0
+                self.y = (self.y - 1) & 0xFFFFFFFF
+            elif cond == "x_not_y":
+                take = self.x != self.y
+            elif cond == "pin":
+                take = gpio.get(self.jmp_pin) == 1
+            elif cond == "not_osre":
+                take = self.osr_count < self.pull_thresh
+            else:
+                raise NotImplementedError("PIO jmp condition %s" % (cond,))
+            if take:
+                self.pc = self.program.labels[target] if isinstance(target, str) else target
+                jumped = True
+        elif op == "wait":
+            polarity, src, index = args
+            if src == "gpio":
+                level = gpio.get(index)
+            elif src == "pin":
+                level = gpio.get((self.in_base + index) % 32)
+            else:
+                raise NotImplementedError("PIO wait on %s" % (src,))
+            if level != polarity:
+                return None
+        else:
+            raise NotImplementedError("PIO instruction %s" % (op,))
+
+        stats.bus_time += (1 + instr.delay_cycles) / self.freq
+        if not exec and not jumped:
+            self.pc = self.program.wrap_target if self.pc == self.program.wrap else self.pc + 1
+        return True
+
+
+class DMA:
+    def __init__(self):
+        self._active = False
+
+    def pack_ctrl(self, size=2, inc_read=True, inc_write=True, treq_sel=0x3F, **kwargs):
+        return {"size": size, "inc_read": inc_read, "inc_write": inc_write, "treq_sel": treq_sel}
+
+    def config(self, read=None, write=None, count=None, ctrl=None, trigger=False):
+        self.read = read
+        self.write = write
+        self.count = count
+        self.ctrl = ctrl or self.pack_ctrl()
+        if trigger:
+            self._transfer()
+
+    def active(self, value=None):
+        if value:
+            self._transfer()
+        return self._active
+
+    def close(self):
+        pass
+
+    def _source_sm(self):
+        # RX FIFO registers of PIO0 and PIO1
+        for base, first in ((0x5020_0020, 0), (0x5030_0020, 4)):
+            if isinstance(self.read, int) and base <= self.read < base + 16:
+                return _state_machines[first + (self.read - base) // 4]
+        raise NotImplementedError("DMA only reads from a PIO RX FIFO")
+
+    def _transfer(self):
+        sm = self._source_sm()
+        size = 1 << self.ctrl["size"]
+        out = memoryview(self.write).cast("B")
+        pos = 0
+        for _ in range(self.count):
+            word = sm._get_word()
+            out[pos:pos + size] = word.to_bytes(4, "little")[:size]
+            if self.ctrl["inc_write"]:
+                pos += size
+        stats.dma_words += self.count
@@ -0,0 +1,122 @@
+# SPDX-FileCopyrightText: © 2024 Michael Bell
+# SPDX-License-Identifier: MIT
+
+# Model of the design's VGA output on uo_out, for the capture path of
+# vga_selftest.py.
+#
+# The timing follows src/vga.sv and src/timing.sv clock by clock, rather than
+# the constants in vga_selftest.py, so the self-test is checked against the
+# design.  The horizontal counter runs from -160 to 639 and the vertical one
+# from -45 to 479, both starting at their lowest value in reset.  hsync and
+# vsync are registered, so are low the clock after the counter enters the
+# sync region: horizontal counter -144 to -49 and vertical counter -35 and
+# -34.  The vertical counter steps when the horizontal one is at 638, and
+# vertical blanking is registered from it, so is aligned with the lines.
+# Colours are output while both counters are at least 0.
+#
+# test_vga_model in test/test.py compares the model with the design's uo_out
+# on every clock of a frame.
+#
+# This is not a model of the RLE decoder: the frames are given already
+# rendered, as (480, 640) arrays of RRGGBB colours, and are shown in order
+# from reset, looping as the stream does.  With half_rate each frame is shown
+# twice except the last, which is followed by the end of the stream, as in
+# rle.decoder.playback_order.
+
+from board import gpio
+
+WIDTH = 640
+HEIGHT = 480
+HFRONT = 16
+HSYNC = 96
+HBACK = 48
+VFRONT = 10
+VSYNC = 2
+VBACK = 33
+
+# Counter values at the start of a line and frame.  The horizontal timing
+# instance in vga.sv moves one clock from the front porch to the back porch
+X_START = -(HFRONT - 1) - HSYNC - (HBACK + 1)
+Y_START = -VFRONT - VSYNC - VBACK
+
+CLK = 0
+RST_N = 1
+UO_OUT = (5, 6, 7, 8, 13, 14, 15, 16)
+
+# uo_out bit for each bit of the RRGGBB colour
+_COLOUR_BITS = {5: 0, 3: 1, 1: 2, 4: 4, 2: 5, 0: 6}
+_HSYNC = 1 << 7
+_VSYNC = 1 << 3
+
+
+def _uo_out_table():
+    table = []
+    for colour in range(64):
+        uo_out = 0
+        for bit, out_bit in _COLOUR_BITS.items():
+            if colour & (1 << bit):
+                uo_out |= 1 << out_bit
+        table.append(uo_out)
+    return table
+
+
+class VGASource:
+    def __init__(self, frames, half_rate=False):
+        table = _uo_out_table()
+        # Each frame as uo_out values, without the syncs
+        self.frames = [bytes(table[c] for c in frame.ravel().tolist()) for frame in frames]
+        # Frame shown for each frame period, up to the restart
+        last = len(frames) - 1
+        self.order = [n for n in range(len(frames)) for _ in range(2 if half_rate and n < last else 1)]
+        self.clocks = 0
+
+        self.x = X_START
+        self.y = Y_START
+        self.hsync = 1
+        self.vsync = 1
+        self.vblank = 1
+        self.frame = 0
+        self.pixel = 0
+
+        for pin in UO_OUT:
+            gpio.driven.add(pin)
+        gpio.listen(CLK, self._clock_edge)
+        self._output()
+
+    def _clock_edge(self, pin, level):
+        if not level:
+            return
+        x = self.x
+        y = self.y
+
+        # The registers take their inputs from before the edge
+        self.hsync = 0 if -HSYNC - (HBACK + 1) <= x < -(HBACK + 1) else 1
+        self.vsync = 0 if -VSYNC - VBACK <= y < -VBACK else 1
+        self.vblank = 1 if y < 0 else 0
+
+        if not gpio.levels[RST_N]:
+            self.x = X_START
+            self.y = Y_START
+            self.frame = 0
+            self.pixel = 0
+        else:
+            self.clocks += 1
+            if x == WIDTH - 2:
+                self.y = Y_START if y == HEIGHT - 1 else y + 1
+            self.x = X_START if x == WIDTH - 1 else x + 1
+        self._output()
+
+    def _output(self):
+        value = (_HSYNC if self.hsync else 0) | (_VSYNC if self.vsync else 0)
+        if self.x >= 0 and not self.vblank:
+            frame = self.order[self.frame % len(self.order)]
+            value |= self.frames[frame][self.pixel]
+            # The decoder moves on to the next pixel for each one shown
+            self.pixel += 1
+            if self.pixel == WIDTH * HEIGHT:
+                self.pixel = 0
+                self.frame += 1
+
+        levels = gpio.levels
+        for i, pin in enumerate(UO_OUT):
+            levels[pin] = (value >> i) & 1
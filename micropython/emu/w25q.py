@@ -0,0 +1,189 @@
+# SPDX-FileCopyrightText: © 2024 Michael Bell
+# SPDX-License-Identifier: MIT
+
+# Model of a W25Q128JV SPI flash, with the commands spi_flash.py uses.
+#
+# Program and erase set the busy bit in status register 1 for the typical
+# time from the datasheet, by the host's clock, scaled by time_scale, and
+# commands other than a status read are ignored while it is set, as on the
+# chip.  Program can only clear bits, and wraps within the page.
+#
+# The model is attached to its pins, so it sees the same bus as the device
+# code: hardware SPI transfers whole bytes through transfer(), and a PIO SPI
+# is followed a clock edge at a time, sampling MOSI on the rising edge and
+# changing MISO on the falling edge (mode 0).
+
+import time
+
+from board import gpio
+
+SIZE = 16 * 1024 * 1024
+PAGE_SIZE = 256
+SECTOR_SIZE = 4096
+BLOCK_SIZE = 65536
+
+# Typical busy times in seconds
+PAGE_PROGRAM_TIME = 0.0004
+SECTOR_ERASE_TIME = 0.045
+BLOCK_ERASE_TIME = 0.150
+
+MANUFACTURER_ID = 0xEF
+DEVICE_ID = 0x17
+JEDEC_ID = bytes((0xEF, 0x40, 0x18))
+
+
+class W25Q128:
+    def __init__(self, cs, sck, mosi, miso, time_scale=1.0):
+        self.cs = cs
+        self.sck = sck
+        self.mosi = mosi
+        self.miso = miso
+        self.time_scale = time_scale
+        self.data = bytearray(b"\xff") * SIZE
+
+        self.selected = False
+        self.powered_down = False
+        self.write_enabled = False
+        self.busy_until = 0.0
+        self.out = 0xFF
+
+        # Totals for the benchmarks
+        self.pages = 0
+        self.erases = 0
+        self.busy_time = 0.0
+        self.status_reads = 0
+
+        self._cmd = None
+        self._bytes = 0
+        self._addr = 0
+        self._program = False
+        self._bits = 0
+        self._in = 0
+        self._out = 0xFF
+
+        gpio.driven.add(miso)
+        gpio.listen(cs, self._cs_edge)
+        gpio.listen(sck, self._sck_edge)
+        gpio.spi_devices.setdefault(sck, []).append(self)
+
+    # Chip select and the byte level protocol
+
+    def busy(self):
+        return time.perf_counter() < self.busy_until
+
+    def _start_busy(self, seconds):
+        seconds *= self.time_scale
+        self.busy_until = time.perf_counter() + seconds
+        self.busy_time += seconds
+        self.write_enabled = False
+
+    def _cs_edge(self, pin, level):
+        if level == 0:
+            self.selected = True
+            self._bytes = 0
+            self._cmd = None
+            self._addr = 0
+            self._bits = 0
+            self.out = 0xFF
+            self._out = self.out
+            gpio.set(self.miso, self._out >> 7)
+        else:
+            if self.selected:
+                self._end()
+            self.selected = False
+
+    def transfer(self, b):
+        """Exchange one byte, returning the byte the flash sent meanwhile"""
+        out = self.out
+        self._receive(b)
+        return out
+
+    def _receive(self, b):
+        n = self._bytes
+        self._bytes = n + 1
+        if n == 0:
+            self._cmd = b
+            self._command(b)
+            return
+
+        cmd = self._cmd
+        if cmd in (0x02, 0x03, 0x20, 0xD8):
+            if n <= 3:
+                self._addr = ((self._addr << 8) | b) & (SIZE - 1)
+                if n == 3 and cmd == 0x03:
+                    self.out = self.data[self._addr]
+                return
+            if cmd == 0x03:
+                self._addr = (self._addr + 1) & (SIZE - 1)
+                self.out = self.data[self._addr]
+            elif cmd == 0x02 and self._program:
+                page = self._addr & ~(PAGE_SIZE - 1)
+                self.data[self._addr] &= b
+                self._addr = page | ((self._addr + 1) & (PAGE_SIZE - 1))
+        elif cmd == 0x05:
+            self.status_reads += 1
+            self.out = self._status()
+        elif cmd == 0x90:
+            # Three address bytes, then the IDs
+            self.out = (0, 0, MANUFACTURER_ID, DEVICE_ID)[n - 1] if n <= 4 else 0xFF
+        elif cmd == 0x9F:
+            self.out = JEDEC_ID[n] if n < 3 else 0xFF
+
+    def _status(self):
+        return (1 if self.busy() else 0) | (2 if self.write_enabled else 0)
+
+    def _command(self, cmd):
+        # Called with the command byte, sets the first byte to send back
+        self._program = False
+        if cmd == 0xAB:
+            self.powered_down = False
+            return
+        if self.powered_down:
+            self._cmd = None
+            return
+        if cmd == 0x05:
+            self.status_reads += 1
+            self.out = self._status()
+            return
+        if self.busy():
+            self._cmd = None
+            return
+        if cmd == 0x06:
+            self.write_enabled = True
+        elif cmd == 0x02:
+            self._program = self.write_enabled
+        elif cmd == 0x90:
+            self.out = 0
+        elif cmd == 0x9F:
+            self.out = JEDEC_ID[0]
+        elif cmd == 0xB9:
+            self.powered_down = True
+
+    def _end(self):
+        # Chip select going high completes program and erase
+        cmd = self._cmd
+        if cmd == 0x02 and self._program and self._bytes > 4:
+            self.pages += 1
+            self._start_busy(PAGE_PROGRAM_TIME)
+        elif cmd in (0x20, 0xD8) and self._bytes == 4 and self.write_enabled:
+            size = SECTOR_SIZE if cmd == 0x20 else BLOCK_SIZE
+            start = self._addr & ~(size - 1)
+            self.data[start:start + size] = b"\xff" * size
+            self.erases += 1
+            self._start_busy(SECTOR_ERASE_TIME if cmd == 0x20 else BLOCK_ERASE_TIME)
+
+    # Clock edges from a PIO SPI
+
+    def _sck_edge(self, pin, level):
+        if not self.selected:
+            return
+        if level:
+            self._in = (self._in << 1) | gpio.levels[self.mosi]
+            self._bits += 1
+            if self._bits == 8:
+                self.transfer(self._in & 0xFF)
+                self._in = 0
+                self._bits = 0
+                self._out = self.out
+        else:
+            gpio.set(self.miso, (self._out >> (7 - self._bits)) & 1)
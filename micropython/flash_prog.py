@@ -1,3 +1,4 @@
+import os
 import time
 import machine
 import gc
@@ -6,8 +7,13 @@ from machine import SPI, Pin
 from ttcontrol import *
 
 from pio_spi import PIOSPI
+from spi_flash import SPIFlash, SECTOR_SIZE, BLOCK_SIZE
 
-def program(filename, addr=0):
+def print_bytes(data):
+    for b in data: print("%02x " % (b,), end="")
+    print()
+
+def open_flash():
     # Select the chip ROM, which should always be present and set the bidirs to all inputs
     # so we can drive them with SPI
     select_design(0)
@@ -23,93 +29,83 @@ def program(filename, addr=0):
     ram_a_sel.on()
     ram_b_sel.on()
 
-    def flash_cmd(data, dummy_len=0, read_len=0):
-        dummy_buf = bytearray(dummy_len)
-        read_buf = bytearray(read_len)
-        
-        flash_sel.off()
-        spi.write(bytearray(data))
-        if dummy_len > 0:
-            spi.readinto(dummy_buf)
-        if read_len > 0:
-            spi.readinto(read_buf)
-        flash_sel.on()
-        
-        return read_buf
-
-    def flash_cmd2(data, data2):
-        flash_sel.off()
-        spi.write(bytearray(data))
-        spi.write(data2)
-        flash_sel.on()
-
-    def print_bytes(data):
-        for b in data: print("%02x " % (b,), end="")
-        print()
-
-    CMD_WRITE = 0x02
-    CMD_READ = 0x03
-    CMD_READ_SR1 = 0x05
-    CMD_WEN = 0x06
-    CMD_SECTOR_ERASE = 0x20
-    CMD_BLOCK_ERASE = 0xD8
-    CMD_ID  = 0x90
-    CMD_LEAVE_CM = 0xFF
-
-    flash_cmd([CMD_LEAVE_CM])
-    id = flash_cmd([CMD_ID], 2, 3)
-    print_bytes(id)
-    
+    flash = SPIFlash(spi, flash_sel)
+    flash.leave_continuous_mode()
+    print_bytes(flash.read_id())
+    flash.read_jedec_id()
+    return flash
+
+def program(filename, addr=0):
+    flash = open_flash()
+    flash.check_fits(os.stat(filename)[6], addr)
+
     gc.collect()
     
+    start = time.ticks_ms()
     with open(filename, "rb") as f:
-    #if False:
         buf_size = 8192
         buf = bytearray(buf_size)
+        mv = memoryview(buf)
         sector = 0
-        while sector < 65536:
+        while True:
             if (sector & 0xF) == 0:
-                flash_cmd([CMD_WEN])
-                flash_cmd([CMD_BLOCK_ERASE, sector >> 4, 0, 0])
+                flash.erase_block(sector * SECTOR_SIZE)
 
+            # Read the next chunk while the flash erases or programs
             num_bytes = f.readinto(buf)
-            while flash_cmd([CMD_READ_SR1], 0, 1)[0] & 1:
-                print("*", end="")
-                time.sleep(0.01)
-            print(".", end="")
-
             if num_bytes == 0:
                 break
 
-            for i in range(0, num_bytes, 256):
-                flash_cmd([CMD_WEN])
-                flash_cmd2([CMD_WRITE, sector >> 4, ((sector & 0xF) << 4) + (i >> 8), 0], buf[i:min(i+256, num_bytes)])
-
-                while flash_cmd([CMD_READ_SR1], 0, 1)[0] & 1:
-                    pass
-                    #print("-", end="")
-                    #time.sleep(0.001)
+            flash.write(sector * SECTOR_SIZE, mv[:num_bytes])
             sector += 2
-            print(f". {sector*4}kB")
+            if (sector & 0xF) == 0:
+                print(f"{sector*4}kB")
             
             if num_bytes != buf_size:
                 break            
-        print("Program done")
+        flash.wait_ready()
+        print(f"Program done, {sector*4}kB in {time.ticks_diff(time.ticks_ms(), start)}ms, {flash.polls} status polls")
 
     with open(filename, "rb") as f:
         data = bytearray(256)
+        data_from_flash = bytearray(256)
         i = addr // 256
         while i < 20:
             num_bytes = f.readinto(data)
             if num_bytes == 0:
                 break
             
-            data_from_flash = flash_cmd([CMD_READ, i >> 8, i & 0xFF, 0], 0, num_bytes)
+            flash.read(i * 256, data_from_flash)
             for j in range(num_bytes):
                 if data[j] != data_from_flash[j]:
                     raise Exception(f"Error at {i:02x}:{j:02x}: {data[j]} != {data_from_flash[j]}")
             i += 1
 
     print("Verify done")
-    data_from_flash = flash_cmd([CMD_READ, 0, 0, 0], 0, 16)
-    print_bytes(data_from_flash)
+    flash.read(0, data_from_flash)
+    print_bytes(data_from_flash[:16])
+
+def receive(addr=0):
+    """Program an image sent by rle/upload.py over the USB serial link.
+
+    addr must be block aligned.  Each block is erased as the first data for
+    it arrives, and pages are programmed while the next frame is received.
+    At the end the image is read back from the flash for the host to check."""
+    import usb_transfer
+
+    # Anything printed before the receiver starts is passed on by the host
+    flash = open_flash()
+
+    def check(length):
+        flash.check_fits(length, addr)
+
+    def sink(offset, data):
+        if (offset & (BLOCK_SIZE - 1)) == 0:
+            flash.erase_block(addr + offset)
+        flash.write(addr + offset, data)
+
+    def readback(length):
+        return flash.crc32(addr, length, bytearray(SECTOR_SIZE))
+
+    usb_transfer.receive(sink, check, readback)
+    flash.wait_ready()
@@ -0,0 +1,195 @@
+import time
+import binascii
+
+CMD_WRITE = 0x02
+CMD_READ = 0x03
+CMD_READ_SR1 = 0x05
+CMD_WEN = 0x06
+CMD_SECTOR_ERASE = 0x20
+CMD_BLOCK_ERASE = 0xD8
+CMD_ID = 0x90
+CMD_JEDEC_ID = 0x9F
+CMD_RELEASE_POWER_DOWN = 0xAB
+CMD_POWER_DOWN = 0xB9
+CMD_LEAVE_CM = 0xFF
+
+PAGE_SIZE = 256
+SECTOR_SIZE = 4096
+BLOCK_SIZE = 65536
+
+# Typical busy times in us, from the W25Q128JV datasheet
+PAGE_PROGRAM_US = 400
+SECTOR_ERASE_US = 45000
+BLOCK_ERASE_US = 150000
+
+class SPIFlash:
+    """Driver for a 25-series SPI NOR flash.
+
+    spi can be a machine.SPI or a PIOSPI, anything with write and readinto.
+    All command buffers are allocated up front, so polling and programming
+    do not allocate and never trigger a garbage collection.
+
+    Program and erase return as soon as the command is sent, and the next
+    command waits for them to finish, so the caller can read the next chunk
+    of data while the flash is busy.  The wait sleeps through the typical
+    time for the operation, less whatever time has already passed, then
+    polls the status register with exponential backoff."""
+
+    def __init__(self, spi, cs):
+        self.spi = spi
+        self.cs = cs
+        self.size = None
+
+        self._cmd = bytearray(4)
+        cmd = memoryview(self._cmd)
+        self._cmd1 = cmd[:1]
+        self._cmd4 = cmd[:4]
+        self._status = bytearray(1)
+        self._id = bytearray(3)
+        self._dummy = bytearray(2)
+
+        self._busy_start = 0
+        self._busy_us = 0
+        self._pending = False
+
+        # Progress counters
+        self.pages = 0
+        self.erases = 0
+        self.polls = 0
+
+        cs.on()
+
+    def _command(self, cmd, addr=-1):
+        # Start a transaction, the caller must end it with cs.on()
+        if self._pending:
+            self.wait_ready()
+        self._cmd[0] = cmd
+        self.cs.off()
+        if addr < 0:
+            self.spi.write(self._cmd1)
+        else:
+            self._cmd[1] = (addr >> 16) & 0xFF
+            self._cmd[2] = (addr >> 8) & 0xFF
+            self._cmd[3] = addr & 0xFF
+            self.spi.write(self._cmd4)
+
+    def _start_busy(self, typical_us):
+        self._busy_start = time.ticks_us()
+        self._busy_us = typical_us
+        self._pending = True
+
+    def command(self, cmd):
+        self._command(cmd)
+        self.cs.on()
+
+    def leave_continuous_mode(self):
+        self.command(CMD_LEAVE_CM)
+
+    def wake(self):
+        # Ready after tRES1, 3us
+        self.command(CMD_RELEASE_POWER_DOWN)
+        time.sleep_us(5)
+
+    def sleep(self):
+        self.command(CMD_POWER_DOWN)
+
+    def read_status(self):
+        self._cmd[0] = CMD_READ_SR1
+        self.cs.off()
+        self.spi.write(self._cmd1)
+        self.spi.readinto(self._status)
+        self.cs.on()
+        self.polls += 1
+        return self._status[0]
+
+    def busy(self):
+        return self.read_status() & 1
+
+    def wait_ready(self):
+        """Wait for any program or erase in progress to finish"""
+        self._pending = False
+        remaining = self._busy_us - time.ticks_diff(time.ticks_us(), self._busy_start)
+        if remaining > 2000:
+            time.sleep_ms(remaining // 1000)
+        elif remaining > 0:
+            time.sleep_us(remaining)
+
+        delay = max(self._busy_us >> 5, 10)
+        max_delay = max(self._busy_us >> 2, 10)
+        while self.read_status() & 1:
+            time.sleep_us(delay)
+            if delay < max_delay:
+                delay <<= 1
+
+    def read_id(self):
+        """Manufacturer and device ID from the legacy 0x90 command"""
+        self._command(CMD_ID)
+        self.spi.readinto(self._dummy)
+        self.spi.readinto(self._id)
+        self.cs.on()
+        return self._id
+
+    def read_jedec_id(self):
+        """Manufacturer, memory type and capacity, and sets size from the capacity"""
+        self._command(CMD_JEDEC_ID)
+        self.spi.readinto(self._id)
+        self.cs.on()
+
+        capacity = self._id[2]
+        if 0x10 <= capacity <= 0x20:
+            self.size = 1 << capacity
+        else:
+            self.size = None
+        return self._id
+
+    def read(self, addr, buf):
+        self._command(CMD_READ, addr)
+        self.spi.readinto(buf)
+        self.cs.on()
+
+    def crc32(self, addr, length, buf):
+        """CRC-32 of length bytes of flash from addr, read a buf at a time"""
+        mv = memoryview(buf)
+        crc = 0
+        pos = 0
+        while pos < length:
+            n = min(len(mv), length - pos)
+            self.read(addr + pos, mv[:n])
+            crc = binascii.crc32(mv[:n], crc)
+            pos += n
+        return crc
+
+    def _erase(self, cmd, addr, typical_us):
+        self.command(CMD_WEN)
+        self._command(cmd, addr)
+        self.cs.on()
+        self._start_busy(typical_us)
+        self.erases += 1
+
+    def erase_sector(self, addr):
+        self._erase(CMD_SECTOR_ERASE, addr, SECTOR_ERASE_US)
+
+    def erase_block(self, addr):
+        self._erase(CMD_BLOCK_ERASE, addr, BLOCK_ERASE_US)
+
+    def write_page(self, addr, data):
+        """Program up to a page of data, which must not cross a page boundary"""
+        self.command(CMD_WEN)
+        self._command(CMD_WRITE, addr)
+        self.spi.write(data)
+        self.cs.on()
+        self._start_busy(PAGE_PROGRAM_US)
+        self.pages += 1
+
+    def write(self, addr, data):
+        """Program already erased flash, splitting data at page boundaries"""
+        mv = memoryview(data)
+        pos = 0
+        while pos < len(mv):
+            end = min(len(mv), pos + PAGE_SIZE - ((addr + pos) & (PAGE_SIZE - 1)))
+            self.write_page(addr + pos, mv[pos:end])
+            pos = end
+
+    def check_fits(self, length, addr=0):
+        if self.size is not None and addr + length > self.size:
+            raise Exception(f"{length} bytes at {addr:06x} does not fit in {self.size // 1024}kB flash")
@@ -0,0 +1,116 @@
+import sys
+import time
+import struct
+import binascii
+import micropython
+
+# Receive an image from rle/upload.py on the host over the USB serial link,
+# instead of reading it through an mpremote mount, which costs a round trip
+# for every read.
+#
+# Every frame from the host is
+#   MAGIC, type, seq (u16), length (u16), payload, crc32 of all before (u32)
+# all little endian.  The type is a byte, "S" (start, payload is the total
+# length as a u32), "D" (data) or "E" (end), as MicroPython's struct has no
+# char format.  Each good frame in sequence is acked with A and its seq.  A
+# bad frame is answered with N and the seq expected, after which frames are
+# dropped until that seq arrives again, so the host can keep a window of
+# frames in flight and go back to the first one missed.  Frames that were
+# already taken are acked again.  After the end frame the device reads back
+# what it stored and sends V, the CRC of all the data received, the CRC of
+# the data read back and the time taken for the transfer in ms.  On an error
+# the device sends X, a u16 length and the message.
+
+MAGIC = b"\xa5\x5a"
+HEADER = struct.calcsize("<2sBHH")
+MAX_PAYLOAD = 4096
+
+def _read_exact(stream, mv):
+    pos = 0
+    while pos < len(mv):
+        n = stream.readinto(mv[pos:])
+        if n:
+            pos += n
+
+def _sync(stream, header):
+    # Find the next MAGIC, a byte at a time
+    one = memoryview(header)[:1]
+    while True:
+        _read_exact(stream, one)
+        if header[0] != MAGIC[0]:
+            continue
+        _read_exact(stream, one)
+        if header[0] == MAGIC[1]:
+            return
+
+def receive(sink, check=None, readback=None):
+    """Receive an image, calling sink(offset, data) for each chunk in order.
+
+    check(length) is called with the total length first, and should raise
+    if it can't be taken.  readback(length) is called at the end, and
+    returns the CRC of the data as stored, which without it is the CRC of
+    the data received.  Returns the length received."""
+    stdin = sys.stdin.buffer
+    stdout = sys.stdout.buffer
+
+    buf = bytearray(HEADER + MAX_PAYLOAD + 4)
+    mv = memoryview(buf)
+    header = bytearray(HEADER)
+    reply = bytearray(3)
+
+    def send(kind, seq):
+        reply[0] = kind
+        struct.pack_into("<H", reply, 1, seq)
+        stdout.write(reply)
+
+    # Ctrl-C in the data must not interrupt the transfer
+    micropython.kbd_intr(-1)
+    try:
+        stdout.write(b"RDY\n")
+        expected = 0
+        offset = 0
+        crc = 0
+        start = time.ticks_ms()
+        while True:
+            _sync(stdin, header)
+            buf[0:2] = MAGIC
+            _read_exact(stdin, mv[2:HEADER])
+            _, kind, seq, length = struct.unpack_from("<2sBHH", buf)
+            if length > MAX_PAYLOAD:
+                send(ord("N"), expected)
+                continue
+            _read_exact(stdin, mv[HEADER:HEADER + length + 4])
+            frame_crc = struct.unpack_from("<I", buf, HEADER + length)[0]
+            if binascii.crc32(mv[:HEADER + length]) != frame_crc:
+                send(ord("N"), expected)
+                continue
+            if seq != expected:
+                # Frames after a bad one are dropped.  A frame that was already
+                # taken is sent again if the host went back too far, so ack it
+                if ((expected - seq) & 0xFFFF) < 0x8000:
+                    send(ord("A"), (expected - 1) & 0xFFFF)
+                continue
+
+            payload = mv[HEADER:HEADER + length]
+            if kind == ord("S"):
+                total = struct.unpack_from("<I", payload)[0]
+                if check is not None:
+                    check(total)
+            elif kind == ord("D"):
+                sink(offset, payload)
+                crc = binascii.crc32(payload, crc)
+                offset += length
+            send(ord("A"), seq)
+            expected = (expected + 1) & 0xFFFF
+
+            if kind == ord("E"):
+                elapsed = time.ticks_diff(time.ticks_ms(), start)
+                stored = crc if readback is None else readback(offset)
+                stdout.write(b"V" + struct.pack("<III", crc, stored, elapsed))
+                return offset
+    except Exception as e:
+        message = str(e).encode()
+        stdout.write(b"X" + struct.pack("<H", len(message)) + message)
+        raise
+    finally:
+        micropython.kbd_intr(3)
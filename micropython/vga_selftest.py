@@ -0,0 +1,121 @@
+import time
+import binascii
+import rp2
+from array import array
+from machine import Pin
+
+from ttcontrol import *
+
+# Check the VGA output of the flashed video against row CRCs written by
+# rle/selftest.py on the host, without a monitor.
+#
+# A whole frame of output is far more than the RP2040's RAM, so instead of
+# capturing at speed the design is clocked by the PIO program below, which
+# samples uo_out once per clock.  When the RX FIFO is full the program
+# stalls with the clock low, so the design waits while each batch of rows is
+# checked, and no frames are missed however long that takes.  Only the rows
+# that don't match are printed.
+
+WIDTH = 640
+HEIGHT = 480
+LINE = 800            # clocks per line
+VBLANK_LINES = 45     # front porch, sync and back porch lines before row 0
+HSYNC_START = 16      # clocks from the start of a line to hsync going low
+HSYNC_LEN = 96        # clocks of hsync low
+BACK_PORCH = 48       # clocks from hsync going high to the first pixel
+ACTIVE_START = HSYNC_START + HSYNC_LEN + BACK_PORCH   # clocks from the start of a line to the first pixel
+
+BATCH = 8             # lines captured per DMA
+
+@rp2.asm_pio(sideset_init=rp2.PIO.OUT_LOW, autopush=True, push_thresh=12, in_shiftdir=rp2.PIO.SHIFT_RIGHT, fifo_join=rp2.PIO.JOIN_RX)
+def pio_clock_capture():
+    nop()                .side(1)
+    in_(pins, 12)        .side(0)
+
+class Capture:
+    def __init__(self, freq):
+        self.sm = rp2.StateMachine(1, pio_clock_capture, 2 * freq,
+                                   in_base=Pin(GPIO_UO_OUT[0]), sideset_base=Pin(GPIO_PROJECT_CLK))
+        self.dma = rp2.DMA()
+        self.scratch = array("I", [0])
+        self.sm.active(1)
+
+    def read(self, buf, count):
+        # Read from the SM1 RX FIFO using the SM1 RX DREQ
+        c = self.dma.pack_ctrl(inc_read=False, treq_sel=5)
+        self.dma.config(read=0x5020_0024, write=buf, ctrl=c, count=count, trigger=True)
+        while self.dma.active():
+            pass
+
+    def skip(self, count):
+        c = self.dma.pack_ctrl(inc_read=False, inc_write=False, treq_sel=5)
+        self.dma.config(read=0x5020_0024, write=self.scratch, ctrl=c, count=count, trigger=True)
+        while self.dma.active():
+            pass
+
+    def close(self):
+        self.sm.active(0)
+        self.dma.close()
+
+def _reset(ui):
+    select_design(969)
+    enable_ui_in(True)
+    write_ui_in(ui)
+
+    clk = Pin(GPIO_PROJECT_CLK, Pin.OUT, value=0)
+    rst_n = Pin(GPIO_PROJECT_RST_N, Pin.OUT, value=1)
+    rst_n.off()
+    for i in range(10):
+        clk.on()
+        clk.off()
+    rst_n.on()
+    return rst_n
+
+def selftest(crc_file, frames=None, ui=0b1001, freq=5_000_000, max_report=20):
+    """Check frames frames of output from reset against the CRCs in crc_file.
+
+    ui must be the ui_in value the CRCs were generated for.  Returns the
+    number of mismatching rows."""
+    with open(crc_file, "rb") as f:
+        available = f.seek(0, 2) // (4 * HEIGHT)
+        f.seek(0)
+        if frames is None or frames > available:
+            frames = available
+
+        rst_n = _reset(ui)
+        cap = Capture(freq)
+        line = array("I", bytes(4 * LINE))
+        buf = array("I", bytes(4 * LINE * BATCH))
+        mv = memoryview(buf)
+        expected = array("I", bytes(4 * HEIGHT))
+        mismatches = 0
+        start = time.ticks_ms()
+
+        try:
+            # Line up with the first line using hsync, uo_out[7]
+            cap.read(line, LINE)
+            hsync = [i for i in range(LINE) if not (line[i] >> 31)]
+            if not hsync:
+                raise Exception("No hsync seen, is the design selected?")
+            offset = hsync[0] - HSYNC_START
+            cap.skip(VBLANK_LINES * LINE + ACTIVE_START + offset - LINE)
+
+            for frame in range(frames):
+                f.readinto(expected)
+                for row in range(0, HEIGHT, BATCH):
+                    cap.read(buf, LINE * BATCH)
+                    for i in range(BATCH):
+                        crc = binascii.crc32(mv[i * LINE:i * LINE + WIDTH])
+                        if crc != expected[row + i]:
+                            mismatches += 1
+                            if mismatches <= max_report:
+                                print("MISMATCH frame %d row %d got %08x expected %08x" % (frame, row + i, crc, expected[row + i]))
+                cap.skip(VBLANK_LINES * LINE)
+        finally:
+            cap.close()
+            rst_n.init(Pin.IN, pull=Pin.PULL_DOWN)
+            Pin(GPIO_PROJECT_CLK, Pin.IN, pull=Pin.PULL_DOWN)
+
+    elapsed = time.ticks_diff(time.ticks_ms(), start) / 1000
+    print("%s: %d frames, %d rows mismatched, %.1fs" % ("PASS" if mismatches == 0 else "FAIL", frames, mismatches, elapsed))
+    return mismatches
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+# SPDX-FileCopyrightText: © 2024 Michael Bell
+# SPDX-License-Identifier: MIT
+
+# Parse yosys.log and nextpnr.log from a pico_ice build into a record, append it
+# to build_history.jsonl and flag regressions against earlier builds.
+#
+# LC usage is deterministic for a given synthesis, so it is compared with the
+# previous build.  Fmax varies from seed to seed, so it is compared with the
+# median of the last few builds.
+#
+#   ./build_report.py            # after make pico_ice
+#   ./build_report.py --show     # print the history
+
+import os
+import re
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+
+HISTORY = "build_history.jsonl"
+
+FMAX_RE = re.compile(r"Max frequency for clock\s+'([^']*clk[^']*)': ([\d.]+) MHz \((PASS|FAIL) at ([\d.]+) MHz\)")
+LC_RE = re.compile(r"ICESTORM_LC:\s+(\d+)/\s*(\d+)")
+CELL_RE = re.compile(r"^\s+(\$?\w+)\s+(\d+)$")
+
+
+def parse_yosys(log_name):
+    # The last statistics block is for the top module after flattening
+    cells = None
+    counts = {}
+    with open(log_name, errors="replace") as f:
+        for line in f:
+            if "Number of cells" in line:
+                cells = int(line.split()[-1])
+                counts = {}
+            elif cells is not None:
+                m = CELL_RE.match(line)
+                if m:
+                    counts[m.group(1)] = int(m.group(2))
+    return {
+        "cells": cells,
+        "dff": sum(n for name, n in counts.items() if name.startswith("SB_DFF")),
+        "lut": counts.get("SB_LUT4", 0),
+        "carry": counts.get("SB_CARRY", 0),
+        "cell_types": counts,
+    }
+
+
+def parse_fmax(log_name):
+    """Fmax and target in MHz of the clock from the last timing report in a
+    nextpnr log, also used by nextpnr_sweep.py"""
+    fmax = target = None
+    with open(log_name, errors="replace") as f:
+        for line in f:
+            m = FMAX_RE.search(line)
+            if m:
+                fmax, target = float(m.group(2)), float(m.group(4))
+    return fmax, target
+
+
+def parse_nextpnr(log_name):
+    record = {"lc": None, "lc_total": None}
+    with open(log_name, errors="replace") as f:
+        for line in f:
+            m = LC_RE.search(line)
+            if m:
+                record["lc"], record["lc_total"] = int(m.group(1)), int(m.group(2))
+    record["fmax"], record["target"] = parse_fmax(log_name)
+    return record
+
+
+def git_version():
+    try:
+        commit = subprocess.run(["git", "describe", "--always", "--dirty"], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = ""
+    return commit or None
+
+
+def load_history(filename):
+    if not os.path.exists(filename):
+        return []
+    with open(filename) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def check(record, history, fmax_tolerance, lc_tolerance, window):
+    problems = []
+    if record["fmax"] is not None and record["target"] is not None and record["fmax"] < record["target"]:
+        problems.append("Fmax %.2f MHz misses the %.2f MHz target" % (record["fmax"], record["target"]))
+
+    if not history:
+        return problems
+
+    fmaxes = [r["fmax"] for r in history[-window:] if r.get("fmax")]
+    if fmaxes and record["fmax"] is not None:
+        median = statistics.median(fmaxes)
+        if record["fmax"] < median * (1 - fmax_tolerance / 100):
+            problems.append("Fmax %.2f MHz is below the recent median of %.2f MHz" % (record["fmax"], median))
+
+    last = history[-1]
+    for key in ("lc", "cells", "dff", "lut"):
+        if record.get(key) is not None and last.get(key):
+            if record[key] > last[key] * (1 + lc_tolerance / 100):
+                problems.append("%s up from %d to %d" % (key.upper(), last[key], record[key]))
+    return problems
+
+
+def show(history):
+    print("%-20s %-16s %6s %6s %6s %6s %8s" % ("Time", "Commit", "Cells", "DFF", "LUT", "LC", "Fmax"))
+    for r in history:
+        print("%-20s %-16s %6s %6s %6s %6s %8s" % (
+            time.strftime("%Y-%m-%d %H:%M", time.localtime(r["time"])), r.get("commit") or "-",
+            r.get("cells"), r.get("dff"), r.get("lut"), r.get("lc"),
+            "%.2f" % (r["fmax"],) if r.get("fmax") else "-"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Record pico_ice build resource usage and timing")
+    parser.add_argument("--yosys-log", default="yosys.log")
+    parser.add_argument("--nextpnr-log", default="nextpnr.log")
+    parser.add_argument("--history", default=HISTORY, help="JSON lines history file")
+    parser.add_argument("--fmax-tolerance", type=float, default=5, help="Allowed Fmax drop in percent")
+    parser.add_argument("--lc-tolerance", type=float, default=1, help="Allowed resource growth in percent")
+    parser.add_argument("--window", type=int, default=5, help="Builds to take the Fmax median over")
+    parser.add_argument("--no-save", action="store_true", help="Check without appending to the history")
+    parser.add_argument("--strict", action="store_true", help="Exit with an error on regressions")
+    parser.add_argument("--show", action="store_true", help="Print the history and exit")
+    args = parser.parse_args()
+
+    history = load_history(args.history)
+    if args.show:
+        show(history)
+        return 0
+
+    record = {"time": int(time.time()), "commit": git_version()}
+    record.update(parse_yosys(args.yosys_log))
+    record.update(parse_nextpnr(args.nextpnr_log))
+
+    print(json.dumps({k: v for k, v in record.items() if k != "cell_types"}))
+    problems = check(record, history, args.fmax_tolerance, args.lc_tolerance, args.window)
+    for problem in problems:
+        print("REGRESSION: " + problem)
+
+    if not args.no_save:
+        with open(args.history, "a") as f:
+            f.write(json.dumps(record) + "\n")
+
+    return 1 if problems and args.strict else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,4 @@
+#!/bin/bash
+
+# Configure the FPGA directly over SPI without writing the flash, then run
+mpremote connect /dev/ttyACM0 + mount . + exec "import os; os.chdir('/'); import fpga_flash_prog; fpga_flash_prog.configure('/remote/rlevga.bin'); import run_rle; run_rle.run(query=False, stop=False, reset_fpga=False)"
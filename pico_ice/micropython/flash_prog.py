@@ -1,7 +1,10 @@
+import os
 import time
 import machine
 from machine import SPI, Pin
 
+from spi_flash import SPIFlash, SECTOR_SIZE
+
 def program(filename):
     for i in range(30):
         Pin(i, Pin.IN, pull=None)
@@ -20,88 +23,53 @@ def program(filename):
     ram_a_sel.on()
     ram_b_sel.on()
 
-    def flash_cmd(data, dummy_len=0, read_len=0):
-        dummy_buf = bytearray(dummy_len)
-        read_buf = bytearray(read_len)
-        
-        flash_sel.off()
-        spi.write(bytearray(data))
-        if dummy_len > 0:
-            spi.readinto(dummy_buf)
-        if read_len > 0:
-            spi.readinto(read_buf)
-        flash_sel.on()
-        
-        return read_buf
-
-    def flash_cmd2(data, data2):
-        flash_sel.off()
-        spi.write(bytearray(data))
-        spi.write(data2)
-        flash_sel.on()
-
     def print_bytes(data):
         for b in data: print("%02x " % (b,), end="")
         print()
 
-    CMD_WRITE = 0x02
-    CMD_READ = 0x03
-    CMD_READ_SR1 = 0x05
-    CMD_WEN = 0x06
-    CMD_SECTOR_ERASE = 0x20
-    CMD_BLOCK_ERASE = 0xD8
-    CMD_ID  = 0x90
-    CMD_LEAVE_CM = 0xFF
-
-    flash_cmd([CMD_LEAVE_CM])
-    id = flash_cmd([CMD_ID], 2, 3)
-    print_bytes(id)
+    flash = SPIFlash(spi, flash_sel)
+    flash.leave_continuous_mode()
+    print_bytes(flash.read_id())
+    flash.read_jedec_id()
+    flash.check_fits(os.stat(filename)[6])
 
+    start = time.ticks_ms()
     with open(filename, "rb") as f:
-    #if False:
-        buf = bytearray(4096)
+        buf = bytearray(SECTOR_SIZE)
+        mv = memoryview(buf)
         sector = 0
         while True:
+            # Read the next chunk while the flash erases or programs
             num_bytes = f.readinto(buf)
-            #print_bytes(buf[:512])
             if num_bytes == 0:
                 break
             
             if (sector & 0xF) == 0:
-                flash_cmd([CMD_WEN])
-                flash_cmd([CMD_BLOCK_ERASE, sector >> 4, 0, 0])
+                flash.erase_block(sector * SECTOR_SIZE)
 
-            while flash_cmd([CMD_READ_SR1], 0, 1)[0] & 1:
-                print("*", end="")
-                time.sleep(0.01)
-            print(".", end="")
-
-            for i in range(0, num_bytes, 256):
-                flash_cmd([CMD_WEN])
-                flash_cmd2([CMD_WRITE, sector >> 4, ((sector & 0xF) << 4) + (i >> 8), 0], buf[i:min(i+256, num_bytes)])
-
-                while flash_cmd([CMD_READ_SR1], 0, 1)[0] & 1:
-                    print("-", end="")
-                    time.sleep(0.01)
-            print(".")
+            flash.write(sector * SECTOR_SIZE, mv[:num_bytes])
             sector += 1
+            if (sector & 0xF) == 0:
+                print(f"{sector*4}kB")
             
-        print("Program done")
+        flash.wait_ready()
+        print(f"Program done, {sector*4}kB in {time.ticks_diff(time.ticks_ms(), start)}ms, {flash.polls} status polls")
 
     with open(filename, "rb") as f:
         data = bytearray(256)
+        data_from_flash = bytearray(256)
         i = 0
         while True:
             num_bytes = f.readinto(data)
             if num_bytes == 0:
                 break
             
-            data_from_flash = flash_cmd([CMD_READ, i >> 8, i & 0xFF, 0], 0, num_bytes)
+            flash.read(i * 256, data_from_flash)
             for j in range(num_bytes):
                 if data[j] != data_from_flash[j]:
                     raise Exception(f"Error at {i:02x}:{j:02x}: {data[j]} != {data_from_flash[j]}")
             i += 1
 
     print("Verify done")
-    data_from_flash = flash_cmd([CMD_READ, 0, 0, 0], 0, 16)
-    print_bytes(data_from_flash)
+    flash.read(0, data_from_flash)
+    print_bytes(data_from_flash[:16])
@@ -1,9 +1,17 @@
+import os
 import time
 import machine
-from machine import SPI, Pin
+from machine import SPI, SoftSPI, Pin
+
+from spi_flash import SPIFlash, SECTOR_SIZE
+
 machine.freq(133_000_000)
 
-def program(prog):
+def print_bytes(data):
+    for b in data: print("%02x " % (b,), end="")
+    print()
+
+def open_flash():
     for i in range(30):
         Pin(i, Pin.IN, pull=None)
 
@@ -19,88 +27,136 @@ def program(prog):
     flash_sel.on()
     ram_sel.off()
 
-    def flash_cmd(data, dummy_len=0, read_len=0):
-        dummy_buf = bytearray(dummy_len)
-        read_buf = bytearray(read_len)
-        
-        flash_sel.off()
-        spi.write(bytearray(data))
-        if dummy_len > 0:
-            spi.readinto(dummy_buf)
-        if read_len > 0:
-            spi.readinto(read_buf)
-        flash_sel.on()
-        
-        return read_buf
-
-    def flash_cmd2(data, data2):
-        flash_sel.off()
-        spi.write(bytearray(data))
-        spi.write(data2)
-        flash_sel.on()
-
-    def print_bytes(data):
-        for b in data: print("%02x " % (b,), end="")
-        print()
-
-    CMD_WRITE = 0x02
-    CMD_READ = 0x03
-    CMD_READ_SR1 = 0x05
-    CMD_WEN = 0x06
-    CMD_SECTOR_ERASE = 0x20
-    CMD_ID  = 0x90
-    CMD_RELEASE_POWER_DOWN = 0xAB
-
-    # Wake up the flash
-    flash_cmd([CMD_RELEASE_POWER_DOWN])
-    time.sleep(1)
-
-    id = flash_cmd([CMD_ID], 2, 3)
-    print_bytes(id)
+    flash = SPIFlash(spi, flash_sel)
+    flash.wake()
+    print_bytes(flash.read_id())
+    flash.read_jedec_id()
+    return flash
+
+def program(prog, verify=True):
+    flash = open_flash()
+    flash.check_fits(os.stat(prog)[6])
 
+    # Sectors that already hold the right data are left alone
+    written = 0
+    skipped = 0
     with open(prog, "rb") as f:
-        buf = bytearray(4096)
+        buf = bytearray(SECTOR_SIZE)
+        mv = memoryview(buf)
+        flash_buf = bytearray(SECTOR_SIZE)
         sector = 0
         while True:
             num_bytes = f.readinto(buf)
-            #print_bytes(buf[:512])
             if num_bytes == 0:
                 break
-            
-            flash_cmd([CMD_WEN])
-            flash_cmd([CMD_SECTOR_ERASE, sector >> 4, (sector & 0xF) << 4, 0])
 
-            while flash_cmd([CMD_READ_SR1], 0, 1)[0] & 1:
-                print("*", end="")
-                time.sleep(0.01)
-            print(".", end="")
+            addr = sector * SECTOR_SIZE
+            flash.read(addr, flash_buf)
+            if flash_buf[:num_bytes] == buf[:num_bytes]:
+                skipped += 1
+                sector += 1
+                continue
 
-            for i in range(0, num_bytes, 256):
-                flash_cmd([CMD_WEN])
-                flash_cmd2([CMD_WRITE, sector >> 4, ((sector & 0xF) << 4) + (i >> 8), 0], buf[i:min(i+256, num_bytes)])
+            flash.erase_sector(addr)
+            flash.write(addr, mv[:num_bytes])
 
-                while flash_cmd([CMD_READ_SR1], 0, 1)[0] & 1:
-                    print("-", end="")
-                    time.sleep(0.01)
-            print(".")
+            if verify:
+                flash.read(addr, flash_buf)
+                if flash_buf[:num_bytes] != buf[:num_bytes]:
+                    for j in range(num_bytes):
+                        if buf[j] != flash_buf[j]:
+                            raise Exception(f"Error at {addr + j:05x}: {buf[j]} != {flash_buf[j]}")
+
+            print(".", end="")
+            written += 1
             sector += 1
-            
-        print("Program done")
 
+    flash.wait_ready()
+    print()
+    print("Program done, %d sectors written, %d unchanged" % (written, skipped))
+    flash.read(0, flash_buf)
+    print_bytes(flash_buf[:16])
+
+def receive(verify=True):
+    """Program a bitstream sent by rle/upload.py over the USB serial link,
+    leaving sectors that already hold the right data alone, and reading
+    the bitstream back from the flash at the end for the host to check"""
+    import usb_transfer
+
+    flash = open_flash()
+    flash_buf = bytearray(SECTOR_SIZE)
+
+    def sink(addr, data):
+        num_bytes = len(data)
+        flash.read(addr, flash_buf)
+        if flash_buf[:num_bytes] == data:
+            return
+
+        flash.erase_sector(addr)
+        flash.write(addr, data)
+        if verify:
+            flash.read(addr, flash_buf)
+            if flash_buf[:num_bytes] != data:
+                raise Exception(f"Verify failed in sector at {addr:05x}")
+
+    def readback(length):
+        return flash.crc32(0, length, flash_buf)
+
+    usb_transfer.receive(sink, flash.check_fits, readback)
+    flash.wait_ready()
+
+def configure(prog, baudrate=4_000_000):
+    """Load the bitstream straight into the iCE40 configuration RAM, leaving the flash untouched.
+
+    The FPGA is configured as an SPI peripheral, which receives on the line the flash drives,
+    so a soft SPI is used with MOSI and MISO swapped.  The flash shares the chip select with
+    the FPGA, so it is put to sleep first to keep it off the bus."""
+    for i in range(30):
+        Pin(i, Pin.IN, pull=None)
+
+    ice_creset_b = machine.Pin(27, machine.Pin.OUT)
+    ice_creset_b.value(0)
+    ice_done = machine.Pin(26, machine.Pin.IN)
+
+    spi = SPI(1, 12_000_000, sck=Pin(10), mosi=Pin(11), miso=Pin(8))
+    cs = Pin(9, Pin.OUT)
+    ram_sel = Pin(14, Pin.OUT)
+    ram_sel.off()
+
+    SPIFlash(spi, cs).sleep()
+
+    spi = SoftSPI(baudrate, polarity=1, phase=1, sck=Pin(10), mosi=Pin(8), miso=Pin(11))
+
+    # Holding chip select low while leaving reset selects SPI peripheral mode,
+    # the UP5K then needs 1.2ms to clear its configuration RAM
+    cs.off()
+    time.sleep_us(1)
+    ice_creset_b.value(1)
+    time.sleep_us(1500)
+
+    cs.on()
+    spi.write(b"\x00")
+    cs.off()
+
+    start = time.ticks_ms()
     with open(prog, "rb") as f:
-        data = bytearray(256)
-        i = 0
+        buf = bytearray(4096)
+        mv = memoryview(buf)
         while True:
-            num_bytes = f.readinto(data)
+            num_bytes = f.readinto(buf)
             if num_bytes == 0:
                 break
-            
-            data_from_flash = flash_cmd([CMD_READ, i >> 8, i & 0xFF, 0], 0, num_bytes)
-            for j in range(num_bytes):
-                if data[j] != data_from_flash[j]:
-                    raise Exception(f"Error at {i:02x}:{j:02x}: {data[j]} != {data_from_flash[j]}")
-            i += 1
-
-    print("Verify done")
-    data_from_flash = flash_cmd([CMD_READ, 0, 0, 0], 0, 16)
-    print_bytes(data_from_flash)
+            spi.write(mv[:num_bytes])
+
+    cs.on()
+    spi.write(bytes(13))
+
+    if ice_done.value() == 0:
+        raise Exception("Configuration failed, CDONE is low")
+
+    # At least 49 more clocks to start the user design
+    spi.write(bytes(7))
+
+    for i in (8, 9, 10, 11):
+        Pin(i, Pin.IN, pull=None)
+    print("Configured in %dms" % (time.ticks_diff(time.ticks_ms(), start),))
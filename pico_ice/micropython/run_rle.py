@@ -10,15 +10,17 @@ import flash_prog
 def pio_capture():
     in_(pins, 8)
     
-def run(query=True, stop=True):
+def run(query=True, stop=True, reset_fpga=True):
     machine.freq(100_000_000)
 
     for i in range(30):
-        Pin(i, Pin.IN, pull=None)
+        if reset_fpga or i not in (26, 27):
+            Pin(i, Pin.IN, pull=None)
 
     flash_sel = Pin(17, Pin.IN, Pin.PULL_UP)
-    ice_creset_b = machine.Pin(27, machine.Pin.OUT)
-    ice_creset_b.value(0)
+    ice_creset_b = machine.Pin(27, machine.Pin.OUT, value=1)
+    if reset_fpga:
+        ice_creset_b.value(0)
     
     Pin(1, Pin.IN, pull=Pin.PULL_UP)
     Pin(2, Pin.IN, pull=Pin.PULL_DOWN)
@@ -29,6 +31,7 @@ def run(query=True, stop=True):
     Pin(6, Pin.IN, pull=Pin.PULL_UP)
     Pin(7, Pin.IN, pull=None)
 
+    # Reconfigure from flash, unless the FPGA was already configured over SPI
     ice_done = machine.Pin(26, machine.Pin.IN)
     time.sleep_us(10)
     ice_creset_b.value(1)
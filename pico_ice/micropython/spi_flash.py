@@ -0,0 +1 @@
+../../micropython/spi_flash.py
\ No newline at end of file
@@ -0,0 +1 @@
+../../micropython/usb_transfer.py
\ No newline at end of file
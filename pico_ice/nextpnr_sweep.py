@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+# SPDX-FileCopyrightText: © 2024 Michael Bell
+# SPDX-License-Identifier: MIT
+
+# Run nextpnr-ice40 with several placement seeds in parallel, keeping the first
+# run that meets timing.  Arguments other than the ones below are passed
+# through to nextpnr.  Each seed logs to nextpnr_seeds/seed<N>.log, and the
+# winning log is copied to nextpnr.log.
+#
+#   ./nextpnr_sweep.py -j 8 --up5k --json rlevga.json --asc rlevga.asc --pcf pico_ice.pcf
+
+import os
+import sys
+import time
+import shutil
+import argparse
+import statistics
+import subprocess
+
+from build_report import parse_fmax
+
+LOG_DIR = "nextpnr_seeds"
+
+
+def seed_args(nextpnr_args, seed):
+    # Give each run its own output files
+    args = []
+    outputs = {}
+    it = iter(nextpnr_args)
+    for arg in it:
+        if arg in ("-r", "--randomize-seed"):
+            continue
+        if arg == "--seed":
+            next(it, None)
+            continue
+        args.append(arg)
+        if arg in ("--asc", "--write", "--sdf"):
+            name = next(it)
+            outputs[name] = os.path.join(LOG_DIR, "seed%d_%s" % (seed, os.path.basename(name)))
+            args.append(outputs[name])
+    return ["--seed", str(seed)] + args, outputs
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Parallel nextpnr-ice40 seed sweep", allow_abbrev=False)
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(), help="Seeds to run at once")
+    parser.add_argument("--max-runs", type=int, default=100, help="Give up after this many seeds")
+    parser.add_argument("--first-seed", type=int, default=1)
+    args, nextpnr_args = parser.parse_known_args()
+
+    os.makedirs(LOG_DIR, exist_ok=True)
+
+    running = {}
+    results = []
+    winner = None
+    next_seed = args.first_seed
+    last_seed = args.first_seed + args.max_runs
+    start = time.time()
+
+    while winner is None and (running or next_seed < last_seed):
+        while len(running) < args.jobs and next_seed < last_seed:
+            cmd_args, outputs = seed_args(nextpnr_args, next_seed)
+            log_name = os.path.join(LOG_DIR, "seed%d.log" % (next_seed,))
+            log = open(log_name, "w")
+            proc = subprocess.Popen(["nextpnr-ice40"] + cmd_args, stdout=log, stderr=subprocess.STDOUT)
+            running[next_seed] = (proc, log, log_name, outputs)
+            next_seed += 1
+
+        time.sleep(0.2)
+        for seed, (proc, log, log_name, outputs) in list(running.items()):
+            if proc.poll() is None:
+                continue
+            log.close()
+            del running[seed]
+            fmax, _ = parse_fmax(log_name)
+            passed = proc.returncode == 0
+            results.append((seed, fmax, passed))
+            print("Seed %3d: %s %s" % (seed, "%6.2f MHz" % (fmax,) if fmax else "  no Fmax", "PASS" if passed else "FAIL"))
+            if passed and winner is None:
+                winner = (seed, log_name, outputs)
+
+    for seed, (proc, log, log_name, outputs) in running.items():
+        proc.kill()
+        proc.wait()
+        log.close()
+
+    fmaxes = [fmax for _, fmax, _ in results if fmax]
+    if fmaxes:
+        print("Fmax over %d seeds: min %.2f, median %.2f, max %.2f MHz (%.0fs)" % (
+            len(fmaxes), min(fmaxes), statistics.median(fmaxes), max(fmaxes), time.time() - start))
+
+    if winner is None:
+        print("No seed met timing")
+        return 2
+
+    seed, log_name, outputs = winner
+    for name, seed_name in outputs.items():
+        shutil.move(seed_name, name)
+    shutil.copy(log_name, "nextpnr.log")
+    print("Using seed %d" % (seed,))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,3 +1,4 @@
 #!/bin/bash
 
-mpremote connect /dev/ttyACM0 + mount . + exec "import os; os.chdir('/'); import fpga_flash_prog; fpga_flash_prog.program('/remote/rlevga.bin')"
+# Needs usb_transfer.py on the device along with the other micropython files
+cd "$(dirname "$0")/.." && python3 -m rle.upload pico_ice/rlevga.bin --target fpga --port /dev/ttyACM0
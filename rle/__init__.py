@@ -0,0 +1,4 @@
+# SPDX-FileCopyrightText: © 2024 Michael Bell
+# SPDX-License-Identifier: MIT
+
+# Host side helpers shared by the RLE encoder and tooling scripts.
@@ -0,0 +1,167 @@
+# SPDX-FileCopyrightText: © 2024 Michael Bell
+# SPDX-License-Identifier: MIT
+
+# Report where the words in an encoded .bin go: words per frame and per row,
+# the run length distribution, how many rows come from repeats, and the rows
+# and frames that come closest to the bandwidth limit.  The file is memory
+# mapped and walked with array operations, so a full 16MB file takes around a
+# second.
+#
+#   python3 -m rle.analyze badapple/badapple640x480.bin --top 10 --json report.json
+
+import sys
+import json
+import mmap
+import argparse
+import numpy as np
+
+from .decoder import WIDTH, HEIGHT
+
+# Every 3 consecutive runs must cover at least this many pixels
+MIN_TRIPLE = 24
+
+# The most runs a row can have and still meet the constraint
+MAX_ROW_WORDS = WIDTH * 3 // MIN_TRIPLE
+
+
+def load_words(filename):
+    """The file as big endian 16-bit words, memory mapped"""
+    with open(filename, "rb") as f:
+        mem = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    return np.frombuffer(mem, dtype=">u2", count=len(mem) // 2)
+
+
+def analyze(words, width=WIDTH, height=HEIGHT, top=10):
+    words = np.asarray(words, dtype=np.int64)
+
+    # The player restarts at the first end word
+    ends = np.flatnonzero((words >> 6) == 0x3ff)
+    stream_len = int(ends[0]) if len(ends) else len(words)
+    w = words[:stream_len]
+
+    is_repeat = (w & 0xfc00) == 0xf800
+    lengths = np.where(is_repeat, 0, w >> 6)
+    repeats = np.where(is_repeat, w & 0x1ff, 0)
+
+    # Each encoded row is a set of runs covering exactly the row width
+    pixel_end = np.cumsum(lengths)
+    pixel_start = pixel_end - lengths
+    row_end = ~is_repeat & (pixel_end % width == 0)
+    misaligned = int(np.count_nonzero(~is_repeat & (pixel_start // width != (pixel_end - 1) // width)))
+
+    # Displayed rows, counting repeated rows, give the frame boundaries
+    shown = row_end.astype(np.int64) + repeats
+    shown_end = np.cumsum(shown)
+    frame_end = (shown > 0) & (shown_end % height == 0)
+    frame_id = np.cumsum(frame_end) - frame_end
+    frames = int(np.count_nonzero(frame_end))
+    complete = int(np.flatnonzero(frame_end)[-1]) + 1 if frames else 0
+
+    # Only complete frames are reported on
+    is_repeat = is_repeat[:complete]
+    lengths = lengths[:complete]
+    repeats = repeats[:complete]
+    row_end = row_end[:complete]
+    frame_id = frame_id[:complete]
+
+    frame_words = np.bincount(frame_id, minlength=frames)
+    frame_repeat_words = np.bincount(frame_id, weights=is_repeat, minlength=frames).astype(np.int64)
+
+    # Runs of each encoded row, and the tightest 3 run window in the row
+    runs = ~is_repeat
+    row_id = (np.cumsum(row_end) - row_end)[runs]
+    run_lengths = lengths[runs]
+    row_frame = frame_id[runs]
+    encoded_rows = int(np.count_nonzero(row_end))
+    row_words = np.bincount(row_id, minlength=encoded_rows)
+    row_first = np.concatenate(([0], np.cumsum(row_words)[:-1]))
+    row_y = (shown_end[:complete][row_end] - 1) % height
+
+    triple = np.full(encoded_rows, width, dtype=np.int64)
+    if len(run_lengths) >= 3:
+        sums = run_lengths[:-2] + run_lengths[1:-1] + run_lengths[2:]
+        same_row = row_id[:-2] == row_id[2:]
+        np.minimum.at(triple, row_id[:-2][same_row], sums[same_row])
+
+    short_runs = int(np.count_nonzero(run_lengths < 2))
+    tight = int(np.count_nonzero(triple < MIN_TRIPLE))
+
+    total_rows = frames * height
+    repeated_rows = int(repeats.sum())
+
+    worst_rows = np.lexsort((triple, -row_words))[:top]
+    worst_frames = np.argsort(-frame_words, kind="stable")[:top]
+
+    return {
+        "words": int(len(words)),
+        "stream_words": stream_len,
+        "trailing_words": int(len(words) - stream_len),
+        "frames": frames,
+        "incomplete_words": stream_len - complete,
+        "encoded_rows": encoded_rows,
+        "repeated_rows": repeated_rows,
+        "repeat_coverage": repeated_rows / total_rows if total_rows else 0.0,
+        "repeat_words": int(np.count_nonzero(is_repeat)),
+        "misaligned_runs": misaligned,
+        "short_runs": short_runs,
+        "rows_over_limit": tight,
+        "words_per_frame": {
+            "mean": float(frame_words.mean()) if frames else 0.0,
+            "min": int(frame_words.min()) if frames else 0,
+            "max": int(frame_words.max()) if frames else 0,
+        },
+        "words_per_row": {
+            "mean": float(row_words.mean()) if encoded_rows else 0.0,
+            "max": int(row_words.max()) if encoded_rows else 0,
+            "limit": MAX_ROW_WORDS,
+        },
+        "run_length_histogram": {int(n): int(c) for n, c in enumerate(np.bincount(run_lengths)) if c},
+        "top_frames": [{"frame": int(f), "words": int(frame_words[f]), "repeat_words": int(frame_repeat_words[f])}
+                       for f in worst_frames],
+        "top_rows": [{"frame": int(row_frame[row_first[r]]), "row": int(row_y[r]),
+                      "words": int(row_words[r]), "min_triple": int(triple[r])}
+                     for r in worst_rows],
+        "frame_words": frame_words.tolist(),
+    }
+
+
+def summary(report):
+    lines = [
+        "%d words, %d frames, %d words after the end" % (report["stream_words"], report["frames"], report["trailing_words"]),
+        "Words per frame: mean %.0f, min %d, max %d" % tuple(report["words_per_frame"][k] for k in ("mean", "min", "max")),
+        "Words per row: mean %.1f, max %d of %d" % tuple(report["words_per_row"][k] for k in ("mean", "max", "limit")),
+        "Repeats: %d words cover %d rows, %.1f%% of displayed rows" % (
+            report["repeat_words"], report["repeated_rows"], 100 * report["repeat_coverage"]),
+        "Invalid: %d runs under 2 pixels, %d rows with 3 runs under %d pixels, %d runs crossing a row end" % (
+            report["short_runs"], report["rows_over_limit"], MIN_TRIPLE, report["misaligned_runs"]),
+        "",
+        "Most expensive frames:",
+    ]
+    for f in report["top_frames"]:
+        lines.append("  frame %5d: %6d words, %d repeats" % (f["frame"], f["words"], f["repeat_words"]))
+    lines.append("Rows closest to the bandwidth limit:")
+    for r in report["top_rows"]:
+        lines.append("  frame %5d row %3d: %3d words, tightest 3 runs %3d pixels" % (
+            r["frame"], r["row"], r["words"], r["min_triple"]))
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Analyze an RLE encoded stream")
+    parser.add_argument("filename")
+    parser.add_argument("--top", type=int, default=10, help="Number of frames and rows to list")
+    parser.add_argument("--json", help="Write the report as JSON to this file, - for stdout")
+    args = parser.parse_args()
+
+    report = analyze(load_words(args.filename), top=args.top)
+    if args.json == "-":
+        json.dump(report, sys.stdout)
+    else:
+        print(summary(report))
+        if args.json:
+            with open(args.json, "w") as f:
+                json.dump(report, f)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+# SPDX-FileCopyrightText: © 2024 Michael Bell
+# SPDX-License-Identifier: MIT
+
+# Measure the memory allocations and garbage collection time of encoding a
+# range of frames, with the row cache as the encoder scripts use it.  Without
+# a frame pattern, synthetic frames are used: a moving silhouette in 2 grey
+# levels, and a dithered colour scene.
+#
+#   python3 -m rle.bench_alloc --count 50
+#   python3 -m rle.bench_alloc badapple/frames/badapple%04d.png --first 1000 --count 50 --palette grey2
+
+import gc
+import time
+import argparse
+import tracemalloc
+import numpy as np
+
+from .quantize import quantize_rgb, quantize_grey
+from .spans import MERGE_ENGINES
+from .encoder import RowCache, encode_frame
+from .bench_merge import load_colours
+
+
+def synthetic_frames(palette, count, max_span_len):
+    y, x = np.mgrid[0:480, 0:640]
+    rng = np.random.default_rng(1)
+    for i in range(count):
+        cx = 320 + 150 * np.sin(i / 10)
+        r = 120 + 40 * np.cos(i / 7) + rng.integers(0, 3, size=(480, 1))
+        mask = (x - cx) ** 2 + (y - 240) ** 2 < r ** 2
+        if palette == "rgb":
+            pixels = np.stack([x * 255 // 640, y * 255 // 480, np.full_like(x, (i * 8) % 256)], axis=2)
+            pixels[mask] = (230, 200, 40)
+            yield quantize_rgb(pixels.astype(np.uint8), "diffuse", max_span_len)
+        else:
+            yield quantize_grey(np.where(mask, 255, 0).astype(np.uint8), 2 if palette == "grey2" else 4, "threshold", max_span_len)
+
+
+class GCTimer:
+    def __init__(self):
+        self.collections = 0
+        self.time = 0.0
+        self._start = 0.0
+
+    def __call__(self, phase, info):
+        if phase == "start":
+            self._start = time.perf_counter()
+        else:
+            self.collections += 1
+            self.time += time.perf_counter() - self._start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure encoder allocations and GC time")
+    parser.add_argument("pattern", nargs="?", help="Frame filename pattern, synthetic frames if not given")
+    parser.add_argument("--first", type=int, default=1)
+    parser.add_argument("--count", type=int, default=20)
+    parser.add_argument("--palette", choices=("rgb", "grey2", "grey4"), default="rgb")
+    parser.add_argument("--merge", choices=MERGE_ENGINES, default="greedy")
+    parser.add_argument("--row-cache", type=int, default=4096)
+    parser.add_argument("--max-span-len", type=int, default=8)
+    args = parser.parse_args()
+
+    if args.pattern:
+        frames = [load_colours(args.pattern % (i,), args.palette, "threshold", args.max_span_len)
+                  for i in range(args.first, args.first + args.count)]
+    else:
+        frames = list(synthetic_frames(args.palette, args.count, args.max_span_len))
+
+    cache = RowCache(args.row_cache, args.merge, args.max_span_len) if args.row_cache else None
+
+    # Time without tracing, then count allocations in a second pass
+    gc_timer = GCTimer()
+    gc.collect()
+    gc.callbacks.append(gc_timer)
+    start = time.perf_counter()
+    words = 0
+    for colours in frames:
+        words += len(encode_frame(colours, args.merge, args.max_span_len, cache))
+    elapsed = time.perf_counter() - start
+    gc.callbacks.remove(gc_timer)
+
+    cache = RowCache(args.row_cache, args.merge, args.max_span_len) if args.row_cache else None
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    for colours in frames:
+        encode_frame(colours, args.merge, args.max_span_len, cache)
+    after = tracemalloc.take_snapshot()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    # Allocations still live at the end are mostly the row cache
+    live = sum(stat.size for stat in after.compare_to(before, "filename"))
+    blocks = sum(stat.count_diff for stat in after.compare_to(before, "filename"))
+
+    n = len(frames)
+    print("%d frames, %.0f words/frame" % (n, words / n))
+    print("Encode time        %8.2f ms/frame" % (1000 * elapsed / n,))
+    print("GC collections     %8d (%.2f ms/frame)" % (gc_timer.collections, 1000 * gc_timer.time / n))
+    print("Peak traced memory %8.2f MB" % (peak / (1024 * 1024),))
+    print("Retained           %8.2f MB in %d blocks" % (live / (1024 * 1024), blocks))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+# SPDX-FileCopyrightText: © 2024 Michael Bell
+# SPDX-License-Identifier: MIT
+
+# Compare the span merge engines on a range of frames, reporting the encoded
+# size and the pixel error against the quantized frame for each.
+#
+#   python3 -m rle.bench_merge badapple/frames/badapple%04d.png --first 1000 --count 50 --palette grey2
+
+import time
+import argparse
+import numpy as np
+from PIL import Image
+
+from .quantize import MODES, quantize_rgb, quantize_grey
+from .spans import MERGE_ENGINES, COLOUR_DISTANCE
+from .encoder import encode_frame
+from .decoder import decode_frame
+
+
+def load_colours(filename, palette, quantize, max_span_len):
+    img = Image.open(filename).convert("RGB").resize((640, 480))
+    pixels = np.asarray(img)
+    if palette == "rgb":
+        return quantize_rgb(pixels, quantize, max_span_len)
+    return quantize_grey(pixels[:, :, 0], 2 if palette == "grey2" else 4, quantize, max_span_len)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the span merge engines")
+    parser.add_argument("pattern", help="Frame filename pattern, e.g. frames/badapple%%04d.png")
+    parser.add_argument("--first", type=int, default=1)
+    parser.add_argument("--count", type=int, default=10)
+    parser.add_argument("--palette", choices=("rgb", "grey2", "grey4"), default="rgb")
+    parser.add_argument("--quantize", choices=MODES, default="threshold")
+    parser.add_argument("--max-span-len", type=int, default=8)
+    args = parser.parse_args()
+
+    totals = {engine: [0, 0, 0.0] for engine in MERGE_ENGINES}
+
+    print("%6s" % ("Frame",) + "".join(" | %8s bytes    error  time(s)" % (e,) for e in MERGE_ENGINES))
+    for i in range(args.first, args.first + args.count):
+        colours = load_colours(args.pattern % (i,), args.palette, args.quantize, args.max_span_len)
+
+        line = "%6d" % (i,)
+        for engine in MERGE_ENGINES:
+            start = time.perf_counter()
+            words = encode_frame(colours, engine, args.max_span_len)
+            elapsed = time.perf_counter() - start
+
+            decoded, _ = decode_frame(words)
+            error = int(COLOUR_DISTANCE[colours, decoded].sum())
+
+            totals[engine][0] += 2 * len(words)
+            totals[engine][1] += error
+            totals[engine][2] += elapsed
+            line += " | %14d %8d %8.3f" % (2 * len(words), error, elapsed)
+        print(line)
+
+    print()
+    for engine in MERGE_ENGINES:
+        nbytes, error, elapsed = totals[engine]
+        print("%-8s %10.0f bytes/frame %12.0f error/frame %8.3fs/frame" %
+              (engine, nbytes / args.count, error / args.count, elapsed / args.count))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+# SPDX-FileCopyrightText: © 2024 Michael Bell
+# SPDX-License-Identifier: MIT
+
+# Software reference for the rle_video decoder, and an index of the frames in
+# an encoded stream.
+
+import numpy as np
+
+WIDTH = 640
+HEIGHT = 480
+
+# Words scanned at a time by FrameIndex
+INDEX_CHUNK = 1 << 18
+
+
+def is_end(word):
+    return (word >> 6) == 0x3ff
+
+
+def is_repeat(word):
+    return (word & 0xfc00) == 0xf800
+
+
+def decode_frame(words, pos=0, width=WIDTH, height=HEIGHT):
+    """Decode the frame starting at words[pos].
+
+    Returns (frame, next pos), or (None, pos) if the stream ends first."""
+    frame = np.zeros((height, width), dtype=np.uint8)
+    x = 0
+    y = 0
+    while y < height:
+        if pos >= len(words) or is_end(words[pos]):
+            return None, pos
+        word = words[pos]
+        pos += 1
+
+        if is_repeat(word):
+            count = min(word & 0x1ff, height - y)
+            frame[y:y+count] = frame[y-1]
+            y += count
+            continue
+
+        length = word >> 6
+        frame[y, x:x+length] = word & 0x3f
+        x += length
+        if x >= width:
+            x = 0
+            y += 1
+
+    return frame, pos
+
+
+class FrameIndex:
+    """Word offsets of the frames in words, built as far as is needed."""
+
+    def __init__(self, words, width=WIDTH, height=HEIGHT, chunk=INDEX_CHUNK):
+        self.words = words
+        self.width = width
+        self.height = height
+        self.chunk = chunk
+        self.offsets = [0]
+        self.complete = False
+        self._scanned = 0
+        self._pixels = 0
+        self._rows = 0
+
+    def scan(self):
+        """Find the frames in the next chunk of the stream"""
+        start = self._scanned
+        w = np.asarray(self.words[start:start + self.chunk], dtype=np.int64)
+        ends = np.flatnonzero((w >> 6) == 0x3ff)
+        if len(ends):
+            w = w[:ends[0]]
+
+        is_repeat = (w & 0xfc00) == 0xf800
+        lengths = np.where(is_repeat, 0, w >> 6)
+        pixel_end = self._pixels + np.cumsum(lengths)
+        row_end = ~is_repeat & (pixel_end % self.width == 0)
+        shown = row_end.astype(np.int64) + np.where(is_repeat, w & 0x1ff, 0)
+        shown_end = self._rows + np.cumsum(shown)
+        frame_end = (shown > 0) & (shown_end % self.height == 0)
+
+        self.offsets.extend((start + np.flatnonzero(frame_end) + 1).tolist())
+        if len(w):
+            self._pixels = int(pixel_end[-1]) % self.width
+            self._rows = int(shown_end[-1]) % self.height
+        self._scanned = start + len(w)
+        if len(ends) or self._scanned >= len(self.words):
+            self.complete = True
+
+    def __len__(self):
+        """The number of complete frames found so far"""
+        return len(self.offsets) - 1
+
+    def frames(self):
+        """The number of frames in the stream, scanning all of it"""
+        while not self.complete:
+            self.scan()
+        return len(self)
+
+    def frame(self, n):
+        """The words of frame n, or None if the stream has fewer frames"""
+        while n + 1 >= len(self.offsets) and not self.complete:
+            self.scan()
+        if n + 1 >= len(self.offsets):
+            return None
+        return self.words[self.offsets[n]:self.offsets[n + 1]]
+
+
+def playback_order(index, count, half_rate=False):
+    """The numbers of the first count frames in index the design displays.
+
+    At 30Hz each frame is shown twice, except a frame followed by the end of
+    the stream, as the restart is picked up while the frame is first shown.
+    After the last complete frame playback starts again from frame 0."""
+    total = index.frames()
+    if total == 0:
+        raise ValueError("No complete frames in the stream")
+
+    words = index.words
+    order = []
+    n = 0
+    while len(order) < count:
+        order.append(n)
+        pos = index.offsets[n + 1]
+        if half_rate and pos < len(words) and not is_end(words[pos]):
+            order.append(n)
+        n = (n + 1) % total
+    return order[:count]
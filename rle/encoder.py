@@ -0,0 +1,164 @@
+# SPDX-FileCopyrightText: © 2024 Michael Bell
+# SPDX-License-Identifier: MIT
+
+# Encode frames of 6bpp colours into the 16-bit word stream read by the player.
+
+import sys
+import time
+from array import array
+from collections import OrderedDict
+
+import numpy as np
+
+from .spans import render_words, row_words
+
+REPEAT_WORD = 0xf800
+END_WORD = 0x3ff << 6
+
+
+class RowCache:
+    """Bounded LRU cache of the words for a row, keyed by the raw bytes of the row.
+
+    The returned arrays are shared, so must not be modified."""
+
+    def __init__(self, size=4096, merge="greedy", max_span_len=8):
+        self.size = size
+        self.merge = merge
+        self.max_span_len = max_span_len
+        self.rows = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.miss_time = 0.0
+
+    def words(self, row):
+        key = row.tobytes()
+        words = self.rows.get(key)
+        if words is not None:
+            self.rows.move_to_end(key)
+            self.hits += 1
+            return words
+
+        start = time.perf_counter()
+        words = row_words(row, self.merge, self.max_span_len)
+        self.miss_time += time.perf_counter() - start
+        self.misses += 1
+
+        self.rows[key] = words
+        if len(self.rows) > self.size:
+            self.rows.popitem(last=False)
+        return words
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        hit_rate = self.hits / lookups if lookups else 0.0
+        saved = self.hits * self.miss_time / self.misses if self.misses else 0.0
+        return "Row cache: %d hits, %d misses, %.1f%% hit rate, ~%.1fs saved" % (
+            self.hits, self.misses, 100 * hit_rate, saved)
+
+
+class RepeatStats:
+    """Row repeat counts for one or more frames.
+
+    Snapped rows are rows that differed from the row above by no more than
+    the snap tolerance, and were replaced by a repeat of it."""
+
+    def __init__(self):
+        self.rows = 0
+        self.repeats = 0
+        self.snapped = 0
+        self.words_saved = 0
+
+    def add(self, other):
+        self.rows += other.rows
+        self.repeats += other.repeats
+        self.snapped += other.snapped
+        self.words_saved += other.words_saved
+
+    def summary(self):
+        hit_rate = self.repeats / self.rows if self.rows else 0.0
+        return "%.1f%% rows repeated (%d snapped), %.1fkB saved by snapping" % (
+            100 * hit_rate, self.snapped, self.words_saved * 2 / 1024)
+
+
+class SnapSchedule:
+    """The snap tolerance for each source frame.
+
+    changes maps a source frame to the tolerance used from that frame on, in
+    the same way as colour_shift_changes in badapple/bit_dump.py.  Frames
+    before the first change use default."""
+
+    def __init__(self, default=0, changes=None):
+        self.default = default
+        self.changes = sorted((changes or {}).items())
+
+    @classmethod
+    def load(cls, filename, default=0):
+        """Read a schedule file of "frame tolerance" lines, # starts a comment"""
+        changes = {}
+        with open(filename) as f:
+            for line_number, line in enumerate(f, 1):
+                fields = line.split("#")[0].split()
+                if not fields:
+                    continue
+                if len(fields) != 2:
+                    raise ValueError("%s:%d: expected frame and tolerance" % (filename, line_number))
+                changes[int(fields[0])] = int(fields[1])
+        return cls(default, changes)
+
+    def tolerance(self, frame):
+        snap = self.default
+        for start, value in self.changes:
+            if start > frame:
+                break
+            snap = value
+        return snap
+
+
+def encode_frame(colours, merge="greedy", max_span_len=8, cache=None, snap=0, stats=None):
+    """Encode an (h, w) array of colours, returning the list of words.
+
+    If snap is non-zero, a row that differs from the row displayed above it in
+    at most snap pixels is encoded as a repeat of that row.  If stats is a
+    RepeatStats, the frame's repeat counts are added to it."""
+    words = []
+    last_words = None
+    last_row = None
+    repeat_count = 0
+    if stats is None:
+        stats = RepeatStats()
+
+    for row in colours:
+        if cache is not None:
+            row_data = cache.words(row)
+        else:
+            row_data = row_words(row, merge, max_span_len)
+
+        stats.rows += 1
+        if row_data == last_words:
+            repeat_count += 1
+            stats.repeats += 1
+        elif snap and last_row is not None and np.count_nonzero(row != last_row) <= snap:
+            repeat_count += 1
+            stats.repeats += 1
+            stats.snapped += 1
+            stats.words_saved += len(row_data)
+        else:
+            if repeat_count != 0:
+                words.append(REPEAT_WORD + repeat_count)
+            repeat_count = 0
+            words.extend(row_data)
+            last_words = row_data
+            if snap:
+                last_row = render_words(row_data)
+
+    if repeat_count != 0:
+        words.append(REPEAT_WORD + repeat_count)
+
+    return words
+
+
+def pack_words(words):
+    data = array("H", words)
+    if sys.byteorder == "little":
+        data.byteswap()
+    return data.tobytes()
@@ -0,0 +1,108 @@
+# SPDX-FileCopyrightText: © 2024 Michael Bell
+# SPDX-License-Identifier: MIT
+
+# Resample the source frames to the rate the player consumes them.
+#
+# The player shows one encoded frame per 60Hz VGA frame, or each frame twice
+# (30Hz) with input 3 high.  Output frame k is shown at k / output_fps
+# seconds, which is source position k * source_fps / output_fps.  Without
+# blending the nearest source frame is used, and source frames that no output
+# frame uses are never loaded.  With blending the two source frames either
+# side of the position are mixed in proportion.
+#
+# The player has no way to hold a frame, so every output frame has to be in
+# the stream, but an output frame that quantizes to (nearly) the same colours
+# as the one before it can reuse its encoded words rather than be encoded
+# again.
+
+from fractions import Fraction
+
+import numpy as np
+
+
+class FrameRateConverter:
+    """Map source frames at source_fps to output frames at output_fps.
+
+    push() the (index, pixels) for each of source_indexes in order, and it
+    yields (index, pixels) for the output frames that are ready, index being
+    the nearest source frame.  The yielded pixels are only valid until the
+    next push."""
+
+    def __init__(self, indexes, source_fps, output_fps=None, blend=False):
+        indexes = list(indexes)
+        step = Fraction(source_fps) / Fraction(output_fps or source_fps)
+        self.blend = blend
+
+        # (a, b, weight of b) for each output frame, as positions in indexes
+        self.schedule = []
+        k = 0
+        while True:
+            pos = k * step
+            if blend:
+                a = int(pos)
+                weight = pos - a
+                b = a + 1 if weight else a
+                if b >= len(indexes):
+                    break
+            else:
+                a = b = int(pos + Fraction(1, 2))
+                weight = 0
+                if a >= len(indexes):
+                    break
+            self.schedule.append((indexes[a], indexes[b], float(weight)))
+            k += 1
+
+        self.source_indexes = sorted(set(i for a, b, _ in self.schedule for i in (a, b)))
+        self._next = 0
+        self._prev = None
+        self._prev_index = None
+        self._out = None
+
+    def __len__(self):
+        return len(self.schedule)
+
+    def push(self, index, pixels):
+        while self._next < len(self.schedule):
+            a, b, weight = self.schedule[self._next]
+            if b != index:
+                break
+            self._next += 1
+            if a == b:
+                yield (index, pixels)
+            else:
+                if a != self._prev_index:
+                    raise ValueError("Source frame %d was not pushed before %d" % (a, index))
+                if self._out is None:
+                    self._out = np.empty_like(pixels)
+                mixed = self._prev * (1.0 - weight) + pixels * weight
+                np.copyto(self._out, mixed + 0.5, casting="unsafe")
+                yield (a if weight < 0.5 else b, self._out)
+
+        if self.blend:
+            if self._prev is None:
+                self._prev = np.empty_like(pixels)
+            np.copyto(self._prev, pixels)
+            self._prev_index = index
+
+
+class DuplicateFilter:
+    """Spot output frames whose colours differ from the last encoded frame
+    in at most tolerance pixels, so its encoded data can be reused.
+
+    A negative tolerance disables the check."""
+
+    def __init__(self, tolerance=-1):
+        self.tolerance = tolerance
+        self.last = None
+        self.duplicates = 0
+
+    def is_duplicate(self, colours):
+        if self.tolerance < 0:
+            return False
+        if self.last is not None and np.count_nonzero(colours != self.last) <= self.tolerance:
+            self.duplicates += 1
+            return True
+        if self.last is None:
+            self.last = np.empty_like(colours)
+        np.copyto(self.last, colours)
+        return False
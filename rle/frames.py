@@ -0,0 +1,51 @@
+# SPDX-FileCopyrightText: © 2024 Michael Bell
+# SPDX-License-Identifier: MIT
+
+# Load numbered source frames for the encoder.
+#
+# Frames are decoded into an array the caller gives, which FramePipeline takes
+# from a fixed set of buffers that it reuses, reading ahead on its own thread.
+# For the grey modes only the channel that is used is resized and copied, and
+# the resize is skipped entirely if the source is already the right size.
+
+import resource
+
+import numpy as np
+from PIL import Image
+
+
+class FrameSource:
+    """The frames pattern % index for each index in indexes.
+
+    buffer is an array of the shape frames are decoded to, (h, w, 3) RGB, or
+    (h, w) if channel is set."""
+
+    def __init__(self, pattern, indexes, size=(640, 480), channel=None):
+        self.pattern = pattern
+        self.indexes = indexes
+        self.size = size
+        self.channel = channel
+        shape = (size[1], size[0]) if channel is not None else (size[1], size[0], 3)
+        self.buffer = np.empty(shape, dtype=np.uint8)
+
+    def decode_into(self, index, out):
+        """Decode frame index into out, which must have the shape of buffer"""
+        with Image.open(self.pattern % (index,)) as img:
+            if img.mode not in ("RGB", "RGBA", "L"):
+                img = img.convert("RGB")
+            if self.channel is not None:
+                if img.mode != "L":
+                    img = img.getchannel(self.channel)
+            elif img.mode != "RGB":
+                img = img.convert("RGB")
+
+            if img.size != self.size:
+                img = img.resize(self.size)
+
+            np.copyto(out, np.asarray(img))
+        return out
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
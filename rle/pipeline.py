@@ -0,0 +1,244 @@
+# SPDX-FileCopyrightText: © 2024 Michael Bell
+# SPDX-License-Identifier: MIT
+
+# Run frame decode, encode and write as three overlapping stages:
+#
+#   reader thread  - reads and decodes frames into a small pool of buffers
+#   caller         - iterates over the pipeline and encodes each frame
+#   writer thread  - writes the encoded data out
+#
+# The queues between the stages are bounded, so at most depth frames are
+# decoded ahead and memory stays flat.  Each stage records how long it was busy
+# and how long it stalled waiting on its neighbours, and the queue depths are
+# sampled, so stats() shows which stage is the bottleneck.
+#
+# With depth 0 everything runs in sequence on the calling thread.
+#
+# An exception in the reader is raised from the iteration, and one in the
+# writer from the next write(), close() or frame requested, after which the
+# pipeline stops.
+
+import time
+import queue
+import threading
+
+import numpy as np
+
+
+class StageStats:
+    def __init__(self, name):
+        self.name = name
+        self.items = 0
+        self.busy = 0.0
+        self.wait_in = 0.0
+        self.wait_out = 0.0
+
+    def __str__(self):
+        return "%-8s %6d items, busy %8.2fs, waiting for input %8.2fs, blocked on output %8.2fs" % (
+            self.name, self.items, self.busy, self.wait_in, self.wait_out)
+
+
+class QueueStats:
+    def __init__(self, name):
+        self.name = name
+        self.samples = 0
+        self.total = 0
+        self.max = 0
+
+    def sample(self, q):
+        depth = q.qsize()
+        self.samples += 1
+        self.total += depth
+        self.max = max(self.max, depth)
+
+    def __str__(self):
+        mean = self.total / self.samples if self.samples else 0.0
+        return "%-8s queue depth mean %.1f, max %d" % (self.name, mean, self.max)
+
+
+class _Stop:
+    pass
+
+
+class _Closed(Exception):
+    pass
+
+
+class FramePipeline:
+    """Iterate over (index, pixels) from a FrameSource, and write() the output.
+
+    pixels is only valid until the next frame is requested."""
+
+    def __init__(self, source, out_file, depth=4):
+        self.source = source
+        self.out_file = out_file
+        self.depth = depth
+
+        self.reader = StageStats("reader")
+        self.encoder = StageStats("encoder")
+        self.writer = StageStats("writer")
+        self.decoded_depth = QueueStats("decoded")
+        self.write_depth = QueueStats("write")
+
+        self._encode_start = None
+        self._encode_blocked = 0.0
+        self._stop = threading.Event()
+        self._error = None
+        self._threads = []
+        if depth > 0:
+            self._free = queue.Queue()
+            for _ in range(depth + 1):
+                self._free.put(np.empty_like(source.buffer))
+            self._decoded = queue.Queue(depth)
+            self._writes = queue.Queue(depth)
+
+    def _wait(self, fn, *args):
+        # Block on a queue, but give up if the pipeline is being closed
+        while not self._stop.is_set():
+            try:
+                return fn(*args, timeout=0.1)
+            except (queue.Empty, queue.Full):
+                pass
+        raise _Closed()
+
+    def _raise_error(self):
+        # The pipeline was stopped, because of an error in the writer if one is stored
+        if self._error is not None:
+            raise self._error
+        raise _Closed()
+
+    def _read_thread(self):
+        try:
+            for index in self.source.indexes:
+                start = time.perf_counter()
+                buf = self._wait(self._free.get)
+                self.reader.wait_out += time.perf_counter() - start
+
+                start = time.perf_counter()
+                self.source.decode_into(index, buf)
+                self.reader.busy += time.perf_counter() - start
+                self.reader.items += 1
+
+                start = time.perf_counter()
+                self._wait(self._decoded.put, (index, buf))
+                self.reader.wait_out += time.perf_counter() - start
+            self._wait(self._decoded.put, _Stop)
+        except _Closed:
+            pass
+        except Exception as e:
+            try:
+                self._wait(self._decoded.put, e)
+            except _Closed:
+                pass
+
+    def _write_thread(self):
+        try:
+            while True:
+                start = time.perf_counter()
+                data = self._wait(self._writes.get)
+                self.writer.wait_in += time.perf_counter() - start
+                if data is _Stop:
+                    return
+
+                start = time.perf_counter()
+                self.out_file.write(data)
+                self.writer.busy += time.perf_counter() - start
+                self.writer.items += 1
+        except _Closed:
+            pass
+        except Exception as e:
+            self._error = e
+            self._stop.set()
+
+    def __iter__(self):
+        if self.depth == 0:
+            for index in self.source.indexes:
+                start = time.perf_counter()
+                pixels = self.source.decode_into(index, self.source.buffer)
+                self.reader.busy += time.perf_counter() - start
+                self.reader.items += 1
+                yield self._encode(index, pixels)
+            return
+
+        self._threads = [threading.Thread(target=self._read_thread, daemon=True),
+                         threading.Thread(target=self._write_thread, daemon=True)]
+        for t in self._threads:
+            t.start()
+
+        buf = None
+        while True:
+            self.decoded_depth.sample(self._decoded)
+            start = time.perf_counter()
+            try:
+                item = self._wait(self._decoded.get)
+            except _Closed:
+                self._raise_error()
+            self.encoder.wait_in += time.perf_counter() - start
+            if buf is not None:
+                self._free.put(buf)
+
+            if item is _Stop:
+                return
+            if isinstance(item, Exception):
+                raise item
+
+            index, buf = item
+            yield self._encode(index, buf)
+
+    def _encode(self, index, pixels):
+        # Time the caller spends on the frame, less time blocked in write()
+        self._encode_start = time.perf_counter()
+        self._encode_blocked = self.encoder.wait_out
+        return index, pixels
+
+    def _encode_done(self):
+        if self._encode_start is not None:
+            blocked = self.encoder.wait_out - self._encode_blocked
+            self.encoder.busy += time.perf_counter() - self._encode_start - blocked
+            self.encoder.items += 1
+            self._encode_start = None
+
+    def write(self, data):
+        if self.depth == 0:
+            start = time.perf_counter()
+            self.out_file.write(data)
+            self.writer.busy += time.perf_counter() - start
+            self.writer.items += 1
+            self.encoder.wait_out += time.perf_counter() - start
+            self._encode_done()
+            return
+
+        self.write_depth.sample(self._writes)
+        start = time.perf_counter()
+        try:
+            self._wait(self._writes.put, data)
+        except _Closed:
+            self._raise_error()
+        self.encoder.wait_out += time.perf_counter() - start
+        self._encode_done()
+
+    def close(self):
+        """Flush the writer and stop the reader, call before closing out_file"""
+        if self.depth == 0 or not self._threads:
+            return
+
+        try:
+            self._wait(self._writes.put, _Stop)
+            self._threads[1].join()
+        except _Closed:
+            pass
+        finally:
+            self._stop.set()
+            for t in self._threads:
+                t.join()
+            self._threads = []
+        if self._error is not None:
+            raise self._error
+
+    def stats(self):
+        stages = (self.reader, self.encoder, self.writer)
+        lines = [str(s) for s in stages]
+        if self.depth > 0:
+            lines += [str(self.decoded_depth), str(self.write_depth)]
+        lines.append("Bottleneck: %s" % (max(stages, key=lambda s: s.busy).name,))
+        return "\n".join(lines)
@@ -0,0 +1,162 @@
+# SPDX-FileCopyrightText: © 2024 Michael Bell
+# SPDX-License-Identifier: MIT
+
+# Play an encoded .bin on the host, at the rate the hardware would show it.
+#
+# The file is memory mapped, and the word offset of each frame is found by
+# rle.decoder.FrameIndex the first time a frame at or beyond it is needed, so
+# opening a 16MB file and seeking anywhere in it is quick.  Between frames
+# the rest of the stream is scanned a chunk per tick, so the slider soon
+# covers the whole file.  Each frame is rendered with
+# rle.quality.render_frame.
+#
+# Playback follows the wall clock: if a frame takes too long to show, later
+# frames are skipped rather than the video running slow.  With --source the
+# source frames are shown alongside, for comparison.
+#
+#   python3 -m rle.preview badapple/badapple640x480.bin --half-rate --source badapple/frames/badapple%04d.png
+#
+# Keys: space to pause, left and right to step a frame, page up and page down
+# to step a second, home to go back to the start.  The slider scrubs.
+
+import time
+import argparse
+import tkinter as tk
+from fractions import Fraction
+
+import numpy as np
+from PIL import Image, ImageTk
+
+from .decoder import FrameIndex
+from .analyze import load_words
+from .frames import FrameSource
+from .quality import PALETTE, render_frame
+
+class Preview:
+    def __init__(self, root, index, rate, source=None, source_map=None):
+        self.root = root
+        self.index = index
+        self.rate = rate
+        self.source = source
+        self.source_map = source_map
+        self.frame = 0
+        self.shown = None
+        self.playing = True
+        self.skipped = 0
+        self._start_time = time.perf_counter()
+        self._start_frame = 0
+
+        width = index.width * (2 if source else 1)
+        self.canvas = tk.Label(root)
+        self.canvas.pack()
+        self.photo = ImageTk.PhotoImage("RGB", (width, index.height))
+        self.canvas.configure(image=self.photo)
+        self.image = np.zeros((index.height, width, 3), dtype=np.uint8)
+
+        self.status = tk.Label(root, anchor="w")
+        self.status.pack(fill="x")
+        self.slider = tk.Scale(root, orient="horizontal", from_=0, to=max(len(index) - 1, 0),
+                               showvalue=False, command=self._scrub)
+        self.slider.pack(fill="x")
+
+        root.bind("<space>", lambda e: self.toggle())
+        root.bind("<Left>", lambda e: self.seek(self.frame - 1))
+        root.bind("<Right>", lambda e: self.seek(self.frame + 1))
+        root.bind("<Prior>", lambda e: self.seek(self.frame - int(self.rate)))
+        root.bind("<Next>", lambda e: self.seek(self.frame + int(self.rate)))
+        root.bind("<Home>", lambda e: self.seek(0))
+
+        self._tick()
+
+    def toggle(self):
+        self.playing = not self.playing
+        self._restart_clock()
+
+    def seek(self, n):
+        self.frame = max(0, n)
+        self._restart_clock()
+        self._show()
+
+    def _scrub(self, value):
+        if int(value) != self.frame:
+            self.seek(int(value))
+
+    def _restart_clock(self):
+        self._start_time = time.perf_counter()
+        self._start_frame = self.frame
+
+    def _show(self):
+        words = self.index.frame(self.frame)
+        if words is None:
+            self.frame = self.shown if self.shown is not None else 0
+            self.playing = False
+            return
+        if self.frame == self.shown:
+            return
+
+        w = self.index.width
+        self.image[:, :w] = PALETTE[render_frame(words, w, self.index.height)]
+        if self.source is not None:
+            source_index = self.source_map(self.frame)
+            try:
+                self.source.decode_into(source_index, self.image[:, w:])
+            except FileNotFoundError:
+                self.image[:, w:] = 0
+        self.photo.paste(Image.fromarray(self.image))
+        self.shown = self.frame
+
+        self.slider.configure(to=max(len(self.index) - 1, 0))
+        self.slider.set(self.frame)
+        self.status.configure(text="Frame %d%s  %.2fs  %d words  %s, %d skipped" % (
+            self.frame, "" if self.index.complete else " (of %d+)" % (len(self.index),),
+            self.frame / self.rate, len(words), "playing" if self.playing else "paused", self.skipped))
+
+    def _tick(self):
+        if not self.index.complete:
+            self.index.scan()
+            self.slider.configure(to=max(len(self.index) - 1, 0))
+        if self.playing:
+            due = self._start_frame + int((time.perf_counter() - self._start_time) * self.rate)
+            if due > self.frame + 1:
+                self.skipped += due - self.frame - 1
+            if due != self.frame:
+                self.frame = due
+                self._show()
+        next_time = self._start_time + (self.frame + 1 - self._start_frame) / self.rate
+        delay = max(1, int(1000 * (next_time - time.perf_counter())))
+        self.root.after(delay if self.playing else 20, self._tick)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Play an encoded .bin file")
+    parser.add_argument("filename")
+    parser.add_argument("--half-rate", action="store_true", help="Play at 30Hz, as with input 3 high")
+    parser.add_argument("--source", help="Source frame filename pattern to show alongside")
+    parser.add_argument("--first", type=int, default=1, help="Index of the first source frame")
+    parser.add_argument("--source-fps", type=float, help="Source frame rate, if the file was encoded with --fps")
+    parser.add_argument("--start", type=int, default=0, help="Frame to start at")
+    args = parser.parse_args()
+
+    rate = 30 if args.half_rate else 60
+    index = FrameIndex(load_words(args.filename))
+
+    source = None
+    source_map = None
+    if args.source:
+        source = FrameSource(args.source, [], size=(index.width, index.height))
+        if args.source_fps:
+            # The nearest source frame, as rle.framerate picks it
+            step = Fraction(args.source_fps) / rate
+            source_map = lambda n: args.first + int(n * step + Fraction(1, 2))
+        else:
+            source_map = lambda n: args.first + n
+
+    root = tk.Tk()
+    root.title(args.filename)
+    preview = Preview(root, index, rate, source, source_map)
+    preview.seek(args.start)
+    root.mainloop()
+
+
+if __name__ == "__main__":
+    main()
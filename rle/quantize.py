@@ -0,0 +1,116 @@
+# SPDX-FileCopyrightText: © 2024 Michael Bell
+# SPDX-License-Identifier: MIT
+
+# Quantize source frames to the 6bpp RRGGBB palette of the Tiny VGA PMOD.
+#
+# Modes:
+#   threshold - hard thresholds per channel, as the original dump scripts did
+#   ordered   - Bayer ordered dither.  Each dither cell is min_run pixels wide so
+#               the dither pattern itself can never produce runs shorter than that
+#   diffuse   - error diffusion in linear light, along the row only.  A colour
+#               change is deferred (and the error carried on) until the current
+#               run is at least min_run pixels long, so the output already meets
+#               the 24 pixel triple constraint for min_run >= 8, apart from the
+#               last run in the row.  Diffusing horizontally only also means
+#               identical source rows stay identical, so row repeats still work.
+#
+# Everything is vectorized across rows (and channels), the only Python loop is
+# over the columns for error diffusion.
+
+import numpy as np
+
+MODES = ("threshold", "ordered", "diffuse")
+
+# Each channel has 2 bits
+LEVEL_VALUES = np.array([0, 85, 170, 255], dtype=np.float32)
+RGB_LEVELS = (0, 1, 2, 3)
+RGB_THRESHOLDS = (45, 100, 170)
+MONO_LEVELS = (0, 3)
+MONO_THRESHOLDS = (100,)
+
+GAMMA = 2.2
+
+
+def _bayer(n):
+    m = np.zeros((1, 1), dtype=np.float32)
+    while m.shape[0] < n:
+        m = np.block([[4 * m, 4 * m + 2], [4 * m + 3, 4 * m + 1]])
+    return (m + 0.5) / (n * n)
+
+
+def _to_linear(v):
+    return (np.asarray(v, dtype=np.float32) / 255.0) ** GAMMA
+
+
+def _threshold(values, levels, thresholds):
+    idx = np.digitize(values, thresholds, right=True)
+    return np.asarray(levels, dtype=np.uint8)[idx]
+
+
+def _ordered(values, levels, thresholds, min_run, size=4):
+    h, w = values.shape[:2]
+    step = 255.0 / (len(levels) - 1)
+    cell = max(1, min_run)
+    bayer = _bayer(size)
+    offset = bayer[np.arange(h)[:, None] % size, (np.arange(w)[None, :] // cell) % size]
+    if values.ndim == 3:
+        offset = offset[:, :, None]
+    return _threshold(values + (offset - 0.5) * step, levels, thresholds)
+
+
+def _diffuse(values, levels, min_run):
+    h, w, c = values.shape
+    levels = np.asarray(levels, dtype=np.uint8)
+    palette = _to_linear(LEVEL_VALUES[levels])
+    linear = _to_linear(values)
+    rows = np.arange(h)
+
+    out = np.empty((h, w, c), dtype=np.uint8)
+    err = np.zeros((h, c), dtype=np.float32)
+    current = np.zeros((h, c), dtype=np.intp)
+    run = np.zeros(h, dtype=np.int32)
+
+    for x in range(w):
+        want = linear[:, x, :] + err
+        nearest = np.abs(want[:, :, None] - palette).argmin(axis=2)
+        if x == 0:
+            current = nearest
+            run[:] = 1
+        else:
+            change = (nearest != current).any(axis=1) & (run >= min_run)
+            current = np.where(change[:, None], nearest, current)
+            run = np.where(change, 1, run + 1)
+        # Clamp the carried error so a held run doesn't wind up indefinitely
+        err = np.clip(want - palette[current], -0.5, 0.5)
+        out[:, x, :] = levels[current]
+
+    return out
+
+
+def _quantize(values, levels, thresholds, mode, min_run):
+    if mode == "threshold":
+        return _threshold(values, levels, thresholds)
+    elif mode == "ordered":
+        return _ordered(values.astype(np.float32), levels, thresholds, min_run)
+    elif mode == "diffuse":
+        squeeze = values.ndim == 2
+        if squeeze:
+            values = values[:, :, None]
+        out = _diffuse(values, levels, min_run)
+        return out[:, :, 0] if squeeze else out
+    raise ValueError("Unknown quantize mode %s" % (mode,))
+
+
+def quantize_rgb(pixels, mode="threshold", min_run=8):
+    """Quantize an (h, w, 3) RGB array to an (h, w) array of RRGGBB colours"""
+    q = _quantize(np.asarray(pixels)[:, :, :3], RGB_LEVELS, RGB_THRESHOLDS, mode, min_run)
+    return (q[:, :, 0] << 4) | (q[:, :, 1] << 2) | q[:, :, 2]
+
+
+def quantize_grey(pixels, levels=4, mode="threshold", min_run=8):
+    """Quantize an (h, w) single channel array to 2 or 4 grey levels"""
+    if levels == 4:
+        q = _quantize(np.asarray(pixels), RGB_LEVELS, RGB_THRESHOLDS, mode, min_run)
+    else:
+        q = _quantize(np.asarray(pixels), MONO_LEVELS, MONO_THRESHOLDS, mode, min_run)
+    return q * np.uint8(0b010101)
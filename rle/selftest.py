@@ -0,0 +1,92 @@
+# SPDX-FileCopyrightText: © 2024 Michael Bell
+# SPDX-License-Identifier: MIT
+
+# Write the per-row CRCs that micropython/vga_selftest.py checks the VGA
+# output of the flashed video against.
+#
+# The device clocks the design from a PIO program that samples the 12 GPIOs
+# from uo_out[0] up on every clock, so each pixel is captured as a 32-bit word
+# holding those pins in its top 12 bits: uo_out[3:0], then ui_in[3:0] (driven
+# by the RP2040, so constant), then uo_out[7:4].  During the visible part of
+# a row hsync and vsync are both high.  The CRC of a row is the CRC-32 of its
+# 640 captured words, little endian, as binascii.crc32 computes on the device.
+#
+# The output is 480 little endian 32-bit CRCs per frame, for each frame the
+# device will see from reset, in the order rle.decoder.playback_order gives:
+# each frame twice in the half frame rate mode, except the frame before the
+# end of the stream, and starting again from the first frame after the end.
+#
+#   python3 -m rle.selftest badapple/badapple640x480.bin --frames 120 --half-rate -o badapple.crc
+
+import zlib
+import argparse
+
+import numpy as np
+
+from .decoder import FrameIndex, playback_order
+from .analyze import load_words
+from .quality import render_frame
+
+# ui_in as run_rle.run sets it: SPI latency 1, half frame rate
+DEFAULT_UI_IN = 0b1001
+
+# uo_out bit for each bit of the RRGGBB colour
+_COLOUR_BITS = {5: 0, 3: 1, 1: 2, 4: 4, 2: 5, 0: 6}
+_HSYNC = 1 << 7
+_VSYNC = 1 << 3
+
+
+def capture_words(ui_in=DEFAULT_UI_IN):
+    """The captured word for each colour in the visible part of a row"""
+    words = np.zeros(64, dtype="<u4")
+    for colour in range(64):
+        uo_out = _HSYNC | _VSYNC
+        for bit, out_bit in _COLOUR_BITS.items():
+            if colour & (1 << bit):
+                uo_out |= 1 << out_bit
+        pins = (uo_out & 0xf) | ((ui_in & 0xf) << 4) | ((uo_out & 0xf0) << 4)
+        words[colour] = pins << 20
+    return words
+
+
+def frame_crcs(colours, words):
+    """CRC of each row of an (h, w) array of colours, as captured"""
+    captured = words[colours]
+    return np.array([zlib.crc32(row.tobytes()) for row in captured], dtype="<u4")
+
+
+def stream_crcs(index, frames, half_rate=False, ui_in=DEFAULT_UI_IN):
+    """Row CRCs for the first frames frames the device will capture"""
+    words = capture_words(ui_in)
+    crcs = []
+    last = None
+    for n in playback_order(index, frames, half_rate):
+        if n != last:
+            colours = render_frame(index.frame(n), index.width, index.height)
+            frame_crc = frame_crcs(colours, words)
+            last = n
+        crcs.append(frame_crc)
+    return np.concatenate(crcs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write the expected row CRCs for the VGA self-test")
+    parser.add_argument("filename")
+    parser.add_argument("-o", "--output", required=True)
+    parser.add_argument("--frames", type=int, default=60, help="Frames to check, from reset")
+    parser.add_argument("--half-rate", action="store_true", help="The video will play with input 3 high")
+    parser.add_argument("--ui-in", type=lambda v: int(v, 0), help="Value of ui_in during the test, default 0x9 or 0x1 without --half-rate")
+    args = parser.parse_args()
+
+    ui_in = args.ui_in if args.ui_in is not None else (DEFAULT_UI_IN if args.half_rate else DEFAULT_UI_IN & 0x7)
+    if bool(ui_in & 0x8) != args.half_rate:
+        parser.error("Input 3 of --ui-in must match --half-rate")
+
+    crcs = stream_crcs(FrameIndex(load_words(args.filename)), args.frames, args.half_rate, ui_in)
+    with open(args.output, "wb") as f:
+        f.write(crcs.tobytes())
+    print("%d frames, %d row CRCs, ui_in 0x%02x" % (args.frames, len(crcs), ui_in))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+# SPDX-FileCopyrightText: © 2024 Michael Bell
+# SPDX-License-Identifier: MIT
+
+# Convert rows of 6bpp colours into runs, and merge runs so that the row can
+# be played back without the data buffer emptying: every run must be at least
+# 2 pixels and any 3 consecutive runs must be at least 3 * max_span_len pixels.
+#
+# While merging, a row's spans are a pair of lists of lengths and colours.
+# Merged rows are packed into an array of 16-bit words, which is compact to
+# cache and compares as a block of memory.
+
+from array import array
+
+import numpy as np
+
+MERGE_ENGINES = ("greedy", "optimal")
+
+# Cost of an extra span in the optimal merge, in units of squared level error
+SPAN_COST = 1
+
+
+def _colour_distance():
+    c = np.arange(64)
+    levels = np.stack([(c >> 4) & 3, (c >> 2) & 3, c & 3], axis=1)
+    return ((levels[:, None, :] - levels[None, :, :]) ** 2).sum(axis=2)
+
+
+# Squared error between two colours, summed over the three channels
+COLOUR_DISTANCE = _colour_distance()
+_DISTANCE = COLOUR_DISTANCE.tolist()
+
+
+def build_spans(row):
+    """Runs of row as (lengths, colours) lists, single pixel runs joining the next run"""
+    row = np.asarray(row)
+    change = np.ones(len(row) + 1, dtype=bool)
+    np.not_equal(row[1:], row[:-1], out=change[1:-1])
+    edges = np.flatnonzero(change)
+    run_lens = (edges[1:] - edges[:-1]).tolist()
+    run_colours = row[edges[:-1]].tolist()
+    if 1 not in run_lens:
+        return run_lens, run_colours
+
+    lens = []
+    colours = []
+    span_len = 0
+    span_colour = 0
+    for run_len, colour in zip(run_lens, run_colours):
+        if span_len > 1:
+            lens.append(span_len)
+            colours.append(span_colour)
+            span_len = 0
+        span_colour = colour
+        span_len += run_len
+
+    if span_len > 1 or not lens:
+        lens.append(span_len)
+        colours.append(span_colour)
+    else:
+        lens[-1] += 1
+
+    return lens, colours
+
+
+def span_words(spans):
+    """Pack (lengths, colours) into the 16-bit words for the row"""
+    lens, colours = spans
+    return array("H", [(span_len << 6) + colour for span_len, colour in zip(lens, colours)])
+
+
+def merge_greedy(spans, max_span_len=8):
+    lens, colours = spans
+    if len(lens) <= 3:
+        return spans
+
+    row_len = sum(lens)
+    while True:
+        shortest_spans = 640
+        shortest_idx = 0
+        for idx in range(len(lens) - 2):
+            slen = lens[idx] + lens[idx+1] + lens[idx+2]
+
+            if slen < shortest_spans:
+                shortest_idx = idx + 1
+                shortest_spans = slen
+
+        if shortest_spans >= 3 * max_span_len:
+            break
+
+        shortest_span, idx = min((a, i) for (i, a) in enumerate(lens[shortest_idx-1:shortest_idx+2]))
+        shortest_idx += idx - 1
+
+        if shortest_idx == 0:
+            lens[1] += shortest_span
+            del lens[0], colours[0]
+        elif shortest_idx == len(lens) - 1:
+            lens[-2] += shortest_span
+            del lens[-1], colours[-1]
+        else:
+            if lens[shortest_idx-1] < lens[shortest_idx+1]:
+                lens[shortest_idx-1] += shortest_span
+            else:
+                lens[shortest_idx+1] += shortest_span
+            del lens[shortest_idx], colours[shortest_idx]
+            if colours[shortest_idx] == colours[shortest_idx-1]:
+                lens[shortest_idx-1] += lens[shortest_idx]
+                del lens[shortest_idx], colours[shortest_idx]
+
+        if sum(lens) != row_len:
+            raise Exception("Span merge error: %s" % (list(zip(lens, colours)),))
+
+        if len(lens) <= 3:
+            break
+
+    return spans
+
+
+def merge_optimal(spans, max_span_len=8, span_cost=SPAN_COST):
+    # Dynamic program over the run boundaries.  A merged span covers one or
+    # more consecutive runs and takes whichever of their colours gives the least
+    # error.  Only the lengths of the last two spans matter for the constraint,
+    # and only up to 3 * max_span_len, so the state at each boundary is
+    # (last span length, last two spans length), both capped.  A larger state
+    # never constrains what can follow, so each boundary keeps just the Pareto
+    # front of (cost, state).
+    #
+    # A span that is already 3 * max_span_len long gains nothing from absorbing
+    # further runs, so candidate spans stop growing once they reach that length.
+    # The result is minimal error + span_cost * spans over those segmentations.
+    lens, colours = spans
+    n = len(lens)
+    if n <= 3:
+        return spans
+
+    min_triple = 3 * max_span_len
+    if all(lens[i] + lens[i+1] + lens[i+2] >= min_triple for i in range(n - 2)):
+        return spans
+
+    fronts = [[] for _ in range(n + 1)]
+    fronts[0] = [(0, min_triple, min_triple, None)]
+
+    for b in range(n):
+        if not fronts[b]:
+            continue
+
+        # In order of cost, a state is dominated if one already kept is at
+        # least as large in both lengths
+        front = []
+        for state in sorted(fronts[b], key=lambda st: (st[0], -st[1], -st[2])):
+            if not any(a >= state[1] and s >= state[2] for _, a, s, _ in front):
+                front.append(state)
+        fronts[b] = front
+
+        errors = {}
+        runs = []
+        length = 0
+        for c in range(b + 1, n + 1):
+            run_len = lens[c - 1]
+            run_colour = colours[c - 1]
+            dist = _DISTANCE[run_colour]
+            for colour in errors:
+                errors[colour] += run_len * dist[colour]
+            if run_colour not in errors:
+                errors[run_colour] = sum(l * dist[col] for l, col in runs)
+            runs.append((run_len, run_colour))
+            length += run_len
+
+            colour = min(errors, key=errors.get)
+            span_len = min(length, min_triple)
+            for idx, (cost, a, s, _) in enumerate(front):
+                if s + span_len < min_triple:
+                    continue
+                fronts[c].append((cost + errors[colour] + span_cost, span_len,
+                                  min(a + span_len, min_triple), (b, idx, colour)))
+
+            if length >= min_triple:
+                break
+
+    end = min(range(len(fronts[n])), key=lambda i: fronts[n][i][0])
+    c = n
+    merged_lens = []
+    merged_colours = []
+    while c > 0:
+        b, end, colour = fronts[c][end][3]
+        span_len = sum(lens[b:c])
+        if merged_colours and merged_colours[-1] == colour:
+            merged_lens[-1] += span_len
+        else:
+            merged_lens.append(span_len)
+            merged_colours.append(colour)
+        c = b
+
+    merged_lens.reverse()
+    merged_colours.reverse()
+    return merged_lens, merged_colours
+
+
+def merge_spans(spans, engine="greedy", max_span_len=8):
+    if engine == "greedy":
+        return merge_greedy(spans, max_span_len)
+    elif engine == "optimal":
+        return merge_optimal(spans, max_span_len)
+    raise ValueError("Unknown merge engine %s" % (engine,))
+
+
+def row_words(row, engine="greedy", max_span_len=8):
+    """Build, merge and pack the spans for a row of colours"""
+    return span_words(merge_spans(build_spans(row), engine, max_span_len))
+
+
+def render_words(words):
+    """The row of colours displayed for a row's words"""
+    words = np.frombuffer(words, dtype=np.uint16)
+    return np.repeat(words & 0x3f, words >> 6)
+
+
+def span_error(row, words):
+    """Total squared level error of displaying a row's words in place of row"""
+    return int(COLOUR_DISTANCE[np.asarray(row), render_words(words)].sum())
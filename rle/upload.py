@@ -0,0 +1,296 @@
+# SPDX-FileCopyrightText: © 2024 Michael Bell
+# SPDX-License-Identifier: MIT
+
+# Send an image to the flash on the board over the USB serial link, using
+# the framed protocol in micropython/usb_transfer.py, instead of through an
+# mpremote mount.
+#
+# The receiver is started through the raw REPL, then the image is sent in 4kB
+# frames, each with a CRC.  Up to --window frames are sent ahead of the acks,
+# so the link never waits on the flash, and a frame the device rejects is
+# sent again along with everything after it.  If no reply comes within the
+# ack timeout, everything not yet acked is sent again.  At the end the device
+# reads the image back from the flash, and its CRC is checked against the
+# file.  Needs pyserial, which mpremote also uses.
+#
+# Several boards can be programmed at once, each from its own thread, with
+# one progress line for all of them and a result per board at the end.  With
+# --all every connected RP2040 running MicroPython is programmed.  Each board
+# is limited by its own flash, so a rack takes about as long as one board.
+#
+#   python3 -m rle.upload badapple/badapple640x480.bin
+#   python3 -m rle.upload pico_ice/rlevga.bin --target fpga
+#   python3 -m rle.upload badapple/badapple640x480.bin --all
+
+import sys
+import time
+import zlib
+import struct
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+MAGIC = b"\xa5\x5a"
+CHUNK = 4096
+
+# Seconds to wait for a reply before sending the unacked frames again, and
+# the number of times to do that before giving up
+ACK_TIMEOUT = 2.0
+RETRIES = 3
+
+# Bytes per second the device reads back from the flash at the end, at the
+# least, to set how long to wait for the verify reply
+READBACK_RATE = 100 * 1024
+
+# USB vendor ID of the RP2040 running MicroPython
+RPI_VID = 0x2e8a
+
+TARGETS = {
+    "tt": "import flash_prog; flash_prog.receive(%(addr)d)",
+    "fpga": "import fpga_flash_prog; fpga_flash_prog.receive()",
+}
+
+
+class UploadError(Exception):
+    pass
+
+
+def frame(kind, seq, payload=b""):
+    """A frame of type kind, b"S" to start, b"D" for data or b"E" to end"""
+    data = struct.pack("<2sBHH", MAGIC, ord(kind), seq, len(payload)) + payload
+    return data + struct.pack("<I", zlib.crc32(data))
+
+
+class RawRepl:
+    def __init__(self, port, timeout=10):
+        # Imported here so upload() can be used without pyserial, on any
+        # object with read and write
+        import serial
+        self.serial = serial.Serial(port, 115200, timeout=timeout)
+
+    def read_until(self, ending):
+        data = self.serial.read_until(ending)
+        if not data.endswith(ending):
+            raise UploadError("Timed out waiting for %r, got %r" % (ending, data[-100:]))
+        return data[:-len(ending)]
+
+    def start(self, code):
+        """Run code in the raw REPL, without waiting for it to finish"""
+        self.serial.write(b"\r\x03\x03")
+        time.sleep(0.1)
+        self.serial.reset_input_buffer()
+        self.serial.write(b"\r\x01")
+        self.read_until(b"raw REPL; CTRL-B to exit\r\n>")
+        self.serial.write(code.encode() + b"\x04")
+        if self.serial.read(2) != b"OK":
+            raise UploadError("Raw REPL did not accept the code")
+
+    def finish(self, timeout=2):
+        """Wait for the code to finish, returning its output and any error.
+
+        Doesn't raise, so it can be used while handling an error."""
+        self.serial.timeout = timeout
+        output = self.serial.read_until(b"\x04")
+        error = self.serial.read_until(b"\x04>")
+        self.serial.write(b"\x02")
+        return output.rstrip(b"\x04").decode(errors="replace"), error.rstrip(b"\x04>").decode(errors="replace")
+
+
+def _read_error(ser, reply):
+    length = struct.unpack("<H", reply[1:])[0]
+    return ser.read(length).decode(errors="replace")
+
+
+def upload(repl, data, window=16, progress=None):
+    """Send data to a receiver that has been started.
+
+    Returns the CRC of the data the device received, the CRC of the data it
+    read back from the flash, and the device's time for the transfer in ms.
+    progress, if given, is called with the number of bytes acked so far."""
+    chunks = [data[i:i + CHUNK] for i in range(0, len(data), CHUNK)]
+    frames = [frame(b"S", 0, struct.pack("<I", len(data)))]
+    frames += [frame(b"D", (i + 1) & 0xffff, chunk) for i, chunk in enumerate(chunks)]
+    frames.append(frame(b"E", len(frames) & 0xffff))
+
+    ser = repl.serial
+    ser.timeout = ACK_TIMEOUT
+    base = 0
+    sent = 0
+    resends = 0
+    retries = 0
+    # The frame last gone back to, until a later one is acked.  A corrupted
+    # frame can draw a second N for the same frame from a false MAGIC in its
+    # remains, which must not send the window again
+    rewound = None
+    while base < len(frames):
+        while sent < len(frames) and sent - base < window:
+            ser.write(frames[sent])
+            sent += 1
+
+        reply = ser.read(3)
+        if len(reply) < 3:
+            retries += 1
+            if retries > RETRIES:
+                raise UploadError("Timed out waiting for an ack at frame %d" % (base,))
+            resends += sent - base
+            sent = base
+            rewound = base
+            continue
+        kind = reply[:1]
+        if kind == b"X":
+            raise UploadError("Device error: %s" % (_read_error(ser, reply),))
+        seq = struct.unpack("<H", reply[1:])[0]
+        # Sequence numbers are 16-bit, find the frame near the window they refer to
+        n = base + ((seq - base + 0x8000) & 0xffff) - 0x8000
+        if kind == b"A":
+            if n + 1 > base:
+                base = n + 1
+                rewound = None
+                retries = 0
+            if progress is not None:
+                progress(min(max(base - 1, 0) * CHUNK, len(data)))
+        elif kind == b"N":
+            # Ignore naks for frames already acked, and repeats
+            if n < base or n == rewound:
+                continue
+            resends += sent - n
+            base = sent = n
+            rewound = n
+        else:
+            raise UploadError("Unexpected reply %r" % (reply,))
+
+    # Acks for frames that were sent twice can still be on the way, and the
+    # device reads back the whole image before replying
+    ser.timeout = ACK_TIMEOUT + len(data) / READBACK_RATE
+    while True:
+        kind = ser.read(1)
+        if kind in (b"A", b"N"):
+            ser.read(2)
+        elif kind == b"X":
+            raise UploadError("Device error: %s" % (_read_error(ser, kind + ser.read(2)),))
+        elif kind == b"V":
+            reply = ser.read(12)
+            if len(reply) == 12:
+                break
+            raise UploadError("Incomplete completion from the device, got %r" % (kind + reply,))
+        else:
+            raise UploadError("No completion from the device, got %r" % (kind,))
+    crc, stored, device_ms = struct.unpack("<III", reply)
+    if resends:
+        print("%d frames resent" % (resends,))
+    return crc, stored, device_ms
+
+
+def find_ports():
+    import serial.tools.list_ports
+    return sorted(p.device for p in serial.tools.list_ports.comports() if p.vid == RPI_VID)
+
+
+def program_board(port, data, target="tt", addr=0, window=16, progress=None):
+    """Program data to the board on port.  Returns the result as a dict,
+    with the device's output and any error rather than raising."""
+    result = {"port": port, "ok": False, "error": None, "output": "", "elapsed": 0.0, "device_ms": 0, "crc": None}
+    try:
+        repl = RawRepl(port)
+    except Exception as e:
+        # serial.SerialException for a missing or busy port
+        result["error"] = str(e)
+        return result
+
+    try:
+        repl.start(TARGETS[target] % {"addr": addr})
+        result["output"] = repl.read_until(b"RDY\n").decode(errors="replace")
+
+        start = time.perf_counter()
+        try:
+            crc, result["crc"], result["device_ms"] = upload(repl, data, window, progress)
+        finally:
+            output, error = repl.finish()
+            result["output"] += output + error
+        result["elapsed"] = time.perf_counter() - start
+
+        expected = zlib.crc32(data)
+        if crc != expected:
+            raise UploadError("CRC mismatch: device received %08x, file %08x" % (crc, expected))
+        if result["crc"] != expected:
+            raise UploadError("Verify failed: flash read back %08x, file %08x" % (result["crc"], expected))
+        result["ok"] = True
+    except Exception as e:
+        # Anything going wrong with one board, such as a garbled reply, must
+        # not lose the other boards' results
+        result["error"] = str(e) if isinstance(e, UploadError) else "%s: %s" % (type(e).__name__, e)
+    finally:
+        repl.serial.close()
+    return result
+
+
+class Progress:
+    """Bytes acked per board, printed as one line"""
+
+    def __init__(self, ports, total):
+        self.done = dict.fromkeys(ports, 0)
+        self.total = total
+        self.lock = threading.Lock()
+        self.last = 0.0
+
+    def callback(self, port):
+        def update(done):
+            with self.lock:
+                self.done[port] = done
+                now = time.perf_counter()
+                if now - self.last > 0.5 or done == self.total:
+                    self.last = now
+                    self.show()
+        return update
+
+    def show(self):
+        boards = " ".join("%s %3.0f%%" % (port.split("/")[-1], 100 * done / self.total) for port, done in self.done.items())
+        sys.stdout.write("\r" + boards)
+        sys.stdout.flush()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Program an image over the USB serial link")
+    parser.add_argument("filename")
+    parser.add_argument("--port", action="append", help="Serial port of a board, can be given more than once, default /dev/ttyACM0")
+    parser.add_argument("--all", action="store_true", help="Program every connected board")
+    parser.add_argument("--target", choices=TARGETS, default="tt", help="tt: the QSPI Pmod flash on the TT demo board, fpga: the pico-ice FPGA flash")
+    parser.add_argument("--addr", type=lambda v: int(v, 0), default=0, help="Flash address, must be 64kB aligned")
+    parser.add_argument("--window", type=int, default=16, help="Frames to send ahead of the acks")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Show each board's output")
+    args = parser.parse_args()
+
+    if args.addr % 65536:
+        parser.error("--addr must be 64kB aligned")
+    ports = find_ports() if args.all else (args.port or ["/dev/ttyACM0"])
+    if not ports:
+        parser.error("No boards found")
+    with open(args.filename, "rb") as f:
+        data = f.read()
+
+    progress = Progress(ports, len(data))
+    start = time.perf_counter()
+    with ThreadPoolExecutor(len(ports)) as pool:
+        futures = [pool.submit(program_board, port, data, args.target, args.addr, args.window, progress.callback(port))
+                   for port in ports]
+        results = [f.result() for f in futures]
+    elapsed = time.perf_counter() - start
+    print()
+
+    for result in results:
+        if args.verbose or not result["ok"]:
+            sys.stdout.write(result["output"])
+        if result["ok"]:
+            print("%s: OK, %d bytes in %.2fs, %.0fkB/s (%.0fkB/s on the device), flash verified crc %08x" % (
+                result["port"], len(data), result["elapsed"], len(data) / result["elapsed"] / 1024,
+                len(data) / max(result["device_ms"], 1) * 1000 / 1024, result["crc"]))
+        else:
+            print("%s: FAILED, %s" % (result["port"], result["error"]))
+
+    failed = sum(1 for r in results if not r["ok"])
+    print("%d of %d boards programmed in %.2fs" % (len(results) - failed, len(results), elapsed))
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
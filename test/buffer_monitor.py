@@ -0,0 +1,110 @@
+# SPDX-FileCopyrightText: © 2024 Michael Bell
+# SPDX-License-Identifier: MIT
+
+# Watch the SPI data buffers inside the design every clock, to measure how
+# close each row comes to running out of data.
+#
+# Occupancy is the number of words buffered ahead of the decoder: one for each
+# of the two spi_buffers that is not empty, plus one if the SPI controller has
+# a completed word (not busy).  For each visible row the minimum and mean
+# occupancy are recorded, along with the number of underrun cycles, where a
+# pixel was displayed while the decoder was still waiting for its next run.
+
+import csv
+from collections import Counter
+
+import cocotb
+from cocotb.triggers import ReadOnly, RisingEdge
+
+
+class BufferMonitor:
+    def __init__(self, dut):
+        top = dut.user_project
+        self.clk = dut.clk
+        self.empty = top.spi_buf_empty
+        self.empty0 = top.spi_buf_empty0
+        self.busy = top.spi_busy
+        self.blank = top.vga_blank
+        self.next_row = top.next_row
+        self.next_frame = top.next_frame
+        self.run_length = top.i_video.run_length
+        self.log = dut._log
+
+        # (frame, row, min occupancy, mean occupancy, underrun cycles)
+        self.rows = []
+        self._task = None
+
+    @staticmethod
+    def available(dut):
+        # The internal signals only exist in the RTL simulation
+        try:
+            dut.user_project.spi_buf_empty
+            dut.user_project.i_video.run_length
+            return True
+        except AttributeError:
+            return False
+
+    def start(self):
+        self._task = cocotb.start_soon(self._run())
+        return self
+
+    def stop(self):
+        if self._task is not None:
+            self._task.kill()
+            self._task = None
+
+    async def _run(self):
+        frame = -1
+        row = 0
+        visible = 0
+        total = 0
+        min_occupancy = 3
+        underruns = 0
+
+        while True:
+            await RisingEdge(self.clk)
+            await ReadOnly()
+
+            if self.next_row.value == 1 or self.next_frame.value == 1:
+                if visible and frame >= 0:
+                    self.rows.append((frame, row, min_occupancy, total / visible, underruns))
+                    if underruns:
+                        self.log.warning(f"Buffer underrun: frame {frame} row {row}, {underruns} cycles")
+                    row += 1
+                visible = 0
+                total = 0
+                min_occupancy = 3
+                underruns = 0
+                if self.next_frame.value == 1:
+                    frame += 1
+                    row = 0
+
+            if self.blank.value == 0:
+                occupancy = (3 - int(self.empty.value) - int(self.empty0.value) - int(self.busy.value))
+                visible += 1
+                total += occupancy
+                min_occupancy = min(min_occupancy, occupancy)
+                if self.run_length.value == 0:
+                    underruns += 1
+
+    def underrun_rows(self):
+        return [(frame, row) for frame, row, _, _, underruns in self.rows if underruns]
+
+    def histogram(self):
+        """Number of rows at each minimum occupancy"""
+        return Counter(r[2] for r in self.rows)
+
+    def write_csv(self, filename):
+        with open(filename, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(("frame", "row", "min_occupancy", "mean_occupancy", "underrun_cycles"))
+            for frame, row, min_occupancy, mean, underruns in self.rows:
+                writer.writerow((frame, row, min_occupancy, "%.2f" % (mean,), underruns))
+
+    def summary(self):
+        hist = self.histogram()
+        lines = ["Rows by minimum buffer occupancy:"]
+        for occupancy in range(4):
+            lines.append("  %d: %d" % (occupancy, hist.get(occupancy, 0)))
+        lines.append("Rows with underruns: %d" % (len(self.underrun_rows()),))
+        return "\n".join(lines)
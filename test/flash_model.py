@@ -0,0 +1,121 @@
+# SPDX-FileCopyrightText: © 2024 Michael Bell
+# SPDX-License-Identifier: MIT
+
+# Model of the QSPI flash, serving 0x6B fast read quad output commands from a
+# memory mapped RLE .bin file, so real encoder output can be played through the
+# design.  Any address can be read, so the model follows wherever the design
+# jumps to for row repeats and frame restarts.
+
+import os
+import sys
+import mmap
+
+import numpy as np
+
+import cocotb
+from cocotb.triggers import ClockCycles, FallingEdge, RisingEdge, Timer
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from rle.decoder import FrameIndex, decode_frame, playback_order
+
+FLASH_SIZE = 16 * 1024 * 1024
+
+
+class QspiFlash:
+    def __init__(self, dut, filename, latency=1):
+        self.dut = dut
+        self.latency = latency
+        self.reads = []
+
+        self._file = open(filename, "rb")
+        if os.path.getsize(filename) > 0:
+            self.mem = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            self.mem = b""
+        self._task = None
+
+    def start(self):
+        self._task = cocotb.start_soon(self._run())
+        return self
+
+    def stop(self):
+        if self._task is not None:
+            self._task.kill()
+            self._task = None
+
+    def close(self):
+        self.stop()
+        if isinstance(self.mem, mmap.mmap):
+            self.mem.close()
+        self._file.close()
+
+    def words(self):
+        """The file as big endian 16-bit words, without copying it"""
+        return np.frombuffer(self.mem, dtype=">u2", count=len(self.mem) // 2)
+
+    def read_byte(self, addr):
+        addr &= FLASH_SIZE - 1
+        return self.mem[addr] if addr < len(self.mem) else 0xFF
+
+    async def _shift_in(self, bits):
+        value = 0
+        for i in range(bits):
+            await RisingEdge(self.dut.spi_clk)
+            value = (value << 1) | int(self.dut.spi_mosi.value)
+        return value
+
+    async def _drive(self, nibble):
+        # Latency is the round trip delay in half clock cycles
+        await Timer(self.latency * 20 + 1, "ns")
+        self.dut.spi_miso.value = nibble
+
+    async def _send_data(self, addr):
+        nibble = 0
+        while True:
+            await FallingEdge(self.dut.spi_clk)
+            byte = self.read_byte(addr + (nibble >> 1))
+            cocotb.start_soon(self._drive(byte & 0xF if nibble & 1 else byte >> 4))
+            nibble += 1
+
+    async def _run(self):
+        while True:
+            if self.dut.spi_cs.value == 1:
+                await FallingEdge(self.dut.spi_cs)
+
+            cmd = await self._shift_in(8)
+            assert cmd == 0x6B, f"Unexpected flash command {cmd:02x}"
+            addr = await self._shift_in(24)
+            self.reads.append(addr)
+
+            for i in range(8):
+                await RisingEdge(self.dut.spi_clk)
+
+            sender = cocotb.start_soon(self._send_data(addr))
+            await RisingEdge(self.dut.spi_cs)
+            sender.kill()
+
+
+def expected_frames(words, count, half_rate=False):
+    """Software decode of the first count frames the design will display"""
+    index = FrameIndex(words)
+    decoded = {}
+    frames = []
+    for n in playback_order(index, count, half_rate):
+        if n not in decoded:
+            decoded[n], _ = decode_frame(index.frame(n))
+        frames.append(decoded[n])
+    return frames
+
+
+async def capture_frame(dut, rows=480):
+    """Capture the first rows rows of the visible area of a frame, starting
+    from the first hsync of the frame"""
+    frame = np.zeros((rows, 640), dtype=np.uint8)
+    await ClockCycles(dut.hsync, 10+2+33)
+    for y in range(rows):
+        await ClockCycles(dut.clk, 49)
+        for x in range(640):
+            frame[y, x] = int(dut.colour.value)
+            await ClockCycles(dut.clk, 1)
+        await ClockCycles(dut.hsync, 1)
+    return frame
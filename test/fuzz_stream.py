@@ -0,0 +1,79 @@
+# SPDX-FileCopyrightText: © 2024 Michael Bell
+# SPDX-License-Identifier: MIT
+
+# Seeded generator of random, valid RLE streams that sit close to the
+# bandwidth limit: runs as short as the rules allow (at least 2 pixels, any 3
+# consecutive runs at least 24 pixels), frequent short row repeats, and an
+# 0xFFC0 restart at the end of the stream.
+
+import random
+
+WIDTH = 640
+HEIGHT = 480
+MIN_RUN = 2
+MIN_TRIPLE = 24
+
+REPEAT_WORD = 0xf800
+END_WORD = 0x3ff << 6
+
+
+def random_row(rng, width=WIDTH):
+    spans = []
+    pos = 0
+    while pos < width:
+        need = MIN_RUN
+        if len(spans) >= 2:
+            need = max(MIN_RUN, MIN_TRIPLE - spans[-1][0] - spans[-2][0])
+        if rng.random() < 0.1:
+            span_len = rng.randint(need, 200)
+        else:
+            span_len = need + min(int(rng.expovariate(0.25)), 30)
+        spans.append([span_len, rng.randrange(64)])
+        pos += span_len
+
+    # Trim the last run to the row, folding it into the previous run if it
+    # would be too short, which can only lengthen the runs around it
+    spans[-1][0] -= pos - width
+    if len(spans) > 1:
+        need = MIN_RUN
+        if len(spans) >= 3:
+            need = max(MIN_RUN, MIN_TRIPLE - spans[-2][0] - spans[-3][0])
+        if spans[-1][0] < need:
+            spans[-2][0] += spans[-1][0]
+            del spans[-1]
+    return spans
+
+
+def random_frame(rng, height=HEIGHT):
+    words = []
+    y = 0
+    while y < height:
+        for span_len, colour in random_row(rng):
+            words.append((span_len << 6) + colour)
+        y += 1
+
+        remaining = height - y
+        if remaining and rng.random() < 0.3:
+            if rng.random() < 0.9:
+                count = rng.randint(1, min(8, remaining))
+            else:
+                count = rng.randint(1, min(511, remaining))
+            words.append(REPEAT_WORD + count)
+            y += count
+    return words
+
+
+def random_stream(seed, frames):
+    """Words for frames random frames followed by a restart"""
+    rng = random.Random(seed)
+    words = []
+    for f in range(frames):
+        words += random_frame(rng)
+    words.append(END_WORD)
+    return words
+
+
+def random_config(seed):
+    """Latency and half frame rate setting to fuzz with"""
+    rng = random.Random(seed ^ 0x5eed)
+    return rng.randint(1, 4), rng.random() < 0.25
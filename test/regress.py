@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+# SPDX-FileCopyrightText: © 2024 Michael Bell
+# SPDX-License-Identifier: MIT
+
+# Fast regression run of the cocotb tests.
+#
+# The simulation is compiled once, with waves off by default, then the tests
+# are run in parallel processes, with each latency of test_latency in its own
+# shard, plus a batch of test_fuzz seeds.  The slow tests that a plain make
+# skips are run too.  The per shard results are merged into results.xml, in
+# the same form as a normal cocotb run.
+#
+#   python3 regress.py --sim verilator -j 8
+
+import os
+import sys
+import time
+import argparse
+import subprocess
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+
+SHARDS = [
+    ("test_sync", "test_sync", {}),
+    ("test_colour", "test_colour", {}),
+    ("test_repeat", "test_repeat", {}),
+    ("test_no_repeat", "test_no_repeat", {}),
+    ("test_stream", "test_stream", {}),
+    ("test_vga_model", "test_vga_model", {}),
+] + [("test_latency[%d]" % (lat,), "test_latency", {"LATENCIES": str(lat)}) for lat in range(1, 5)]
+
+
+def fuzz_shards(count, base):
+    return [("test_fuzz[%d]" % (seed,), "test_fuzz", {"FUZZ_SEED": str(seed)}) for seed in range(base, base + count)]
+
+
+def make(args, env=None, log=None):
+    return subprocess.run(["make", "--no-print-directory"] + args, cwd=TEST_DIR,
+                          env=env, stdout=log, stderr=subprocess.STDOUT if log else None).returncode
+
+
+def run_shard(shard, make_args, sim_build):
+    name, testcase, extra_env = shard
+    # Avoid [] in file names, make treats them as wildcards
+    file_name = name.replace("[", "_").replace("]", "")
+    results = os.path.join(sim_build, "results_%s.xml" % (file_name,))
+    log_name = os.path.join(TEST_DIR, sim_build, "%s.log" % (file_name,))
+    env = dict(os.environ, SLOW_TESTS="1", **extra_env)
+
+    if os.path.exists(os.path.join(TEST_DIR, results)):
+        os.remove(os.path.join(TEST_DIR, results))
+
+    start = time.time()
+    with open(log_name, "w") as log:
+        make(make_args + ["TESTCASE=%s" % (testcase,), "COCOTB_RESULTS_FILE=%s" % (results,), "sim"], env, log)
+    return name, os.path.join(TEST_DIR, results), log_name, time.time() - start
+
+
+def merge_results(shard_results, out_name):
+    suite = ET.Element("testsuite", name="all", package="all")
+    failures = 0
+    for name, results, log_name, elapsed in shard_results:
+        testcases = []
+        if os.path.exists(results):
+            testcases = list(ET.parse(results).getroot().iter("testcase"))
+        if not testcases:
+            testcase = ET.Element("testcase", name=name, classname="test")
+            ET.SubElement(testcase, "failure", message="No results, see %s" % (log_name,))
+            testcases = [testcase]
+
+        for testcase in testcases:
+            testcase.set("name", name)
+            if testcase.find("failure") is not None or testcase.find("error") is not None:
+                failures += 1
+            suite.append(testcase)
+
+    root = ET.Element("testsuites", name="results")
+    root.append(suite)
+    ET.ElementTree(root).write(os.path.join(TEST_DIR, out_name), encoding="UTF-8", xml_declaration=True)
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the cocotb tests in parallel shards")
+    parser.add_argument("--sim", default="icarus", help="Simulator, icarus or verilator")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(), help="Number of shards to run at once")
+    parser.add_argument("--waves", action="store_true", help="Dump waves, note all shards write to the same file")
+    parser.add_argument("--fuzz", type=int, default=4, help="Number of random stream seeds to run")
+    parser.add_argument("--fuzz-seed", type=int, default=1, help="First random stream seed")
+    parser.add_argument("-o", "--output", default="results.xml", help="Merged results file")
+    args = parser.parse_args()
+
+    sim_build = "sim_build/regress_%s%s" % (args.sim, "_waves" if args.waves else "")
+    make_args = ["SIM=%s" % (args.sim,), "WAVES=%d" % (args.waves,), "SIM_BUILD=%s" % (sim_build,)]
+
+    start = time.time()
+    if make(make_args + ["build"]) != 0:
+        print("Build failed")
+        return 1
+    print("Build took %.1fs" % (time.time() - start,))
+
+    shards = SHARDS + fuzz_shards(args.fuzz, args.fuzz_seed)
+    with ThreadPoolExecutor(args.jobs) as pool:
+        shard_results = list(pool.map(lambda shard: run_shard(shard, make_args, sim_build), shards))
+
+    for name, results, log_name, elapsed in shard_results:
+        print("%-20s %7.1fs  %s" % (name, elapsed, log_name))
+
+    failures = merge_results(shard_results, args.output)
+    print("%d shards, %d failures, %.1fs total" % (len(shards), failures, time.time() - start))
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
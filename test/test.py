@@ -1,10 +1,31 @@
 # SPDX-FileCopyrightText: © 2024 Michael Bell
 # SPDX-License-Identifier: MIT
 
+import os
+import sys
+import tempfile
+
+import numpy as np
+
 import cocotb
 from cocotb.clock import Clock
 from cocotb.triggers import ClockCycles, FallingEdge, RisingEdge, Timer
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from buffer_monitor import BufferMonitor
+from flash_model import QspiFlash, capture_frame, expected_frames
+from fuzz_stream import random_config, random_stream
+from rle.encoder import END_WORD, encode_frame, pack_words
+
+# The latencies test_latency runs through, can be restricted so that
+# regress.py can run each latency in its own process
+LATENCIES = [int(lat) for lat in os.environ.get("LATENCIES", "1,2,3,4").split(",")]
+
+# Tests that check every clock of whole frames only run with SLOW_TESTS=1,
+# which regress.py sets, so a plain make stays quick
+SLOW_TESTS = os.environ.get("SLOW_TESTS") == "1"
+
 
 @cocotb.test()
 async def test_sync(dut):
@@ -352,7 +373,7 @@ async def test_latency(dut):
     clock = Clock(dut.clk, 40, units="ns")
     cocotb.start_soon(clock.start())
 
-    for lat in range(1, 5):
+    for lat in LATENCIES:
         # Reset
         dut._log.info(f"Reset, latency {lat}")
         dut.ena.value = 1
@@ -404,3 +425,181 @@ async def test_latency(dut):
                 await ClockCycles(dut.hsync, 1)
 
         await colour_gen
+
+# Rows test_stream checks without SLOW_TESTS
+SMOKE_ROWS = 16
+
+def write_test_stream(filename, frames):
+    # Coloured blocks with a moving circle of short runs, encoded by the real encoder
+    yy, xx = np.mgrid[0:480, 0:640]
+    words = []
+    for f in range(frames):
+        colours = ((xx // 40 + yy // 60 + f) & 0x3f).astype(np.uint8)
+        circle = (xx - 280 - 40 * f) ** 2 + (yy - 240) ** 2 < 150 ** 2
+        colours[circle] = ((xx[circle] // 10 + yy[circle] // 3) & 0x3f)
+        words += encode_frame(colours)
+    words.append(END_WORD)
+
+    with open(filename, "wb") as f:
+        f.write(pack_words(words))
+
+@cocotb.test()
+async def test_stream(dut):
+    dut._log.info("Start")
+
+    # Play RLE_BIN if set, otherwise a small stream from the encoder
+    frames = int(os.environ.get("RLE_FRAMES", "2"))
+    filename = os.environ.get("RLE_BIN")
+    if not filename:
+        fd, filename = tempfile.mkstemp(suffix=".bin")
+        os.close(fd)
+        write_test_stream(filename, frames)
+    latency = 2
+
+    # Whole frames are captured with SLOW_TESTS or a file to play, otherwise
+    # the first rows of the stream are checked
+    full = SLOW_TESTS or bool(os.environ.get("RLE_BIN"))
+    rows = 480 if full else SMOKE_ROWS
+    if not full:
+        frames = 1
+
+    # Set the clock period to 40 ns (25 MHz)
+    clock = Clock(dut.clk, 40, units="ns")
+    cocotb.start_soon(clock.start())
+
+    # Reset
+    dut._log.info("Reset")
+    dut.ena.value = 1
+    dut.ui_in.value = latency
+    dut.spi_miso.value = 0
+    dut.rst_n.value = 0
+    await ClockCycles(dut.clk, 10)
+    dut.rst_n.value = 1
+
+    flash = QspiFlash(dut, filename, latency).start()
+    expected = expected_frames(flash.words(), frames)
+
+    # Record buffer occupancy per row, written to MONITOR_CSV, when whole
+    # frames are captured
+    monitor = BufferMonitor(dut).start() if full and BufferMonitor.available(dut) else None
+
+    await ClockCycles(dut.hsync, 1)
+
+    for f in range(frames):
+        frame = await capture_frame(dut, rows)
+        diff = np.argwhere(frame != expected[f][:rows])
+        if len(diff) != 0:
+            y, x = diff[0]
+            underruns = monitor.underrun_rows()[:10] if monitor else "not monitored"
+            assert False, (f"Frame {f}: {len(diff)} pixels differ, first at ({x}, {y}): {frame[y, x]} != {expected[f][y, x]}, "
+                           f"rows with buffer underruns (frame, row): {underruns}")
+        dut._log.info(f"Frame {f} matches, {len(flash.reads)} reads so far")
+
+    flash.close()
+    if monitor:
+        monitor.stop()
+        monitor.write_csv(os.environ.get("MONITOR_CSV", "buffer_monitor.csv"))
+        dut._log.info(monitor.summary())
+    if not os.environ.get("RLE_BIN"):
+        os.remove(filename)
+
+@cocotb.test(skip=not SLOW_TESTS)
+async def test_vga_model(dut):
+    # Check the model of uo_out that micropython/emu/bench.py runs the VGA
+    # self-test against, clock by clock, over a frame and into the next
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "micropython", "emu"))
+    from board import gpio
+    from vga import CLK, RST_N, UO_OUT, VGASource
+
+    fd, filename = tempfile.mkstemp(suffix=".bin")
+    os.close(fd)
+    write_test_stream(filename, 2)
+    latency = 2
+
+    # Set the clock period to 40 ns (25 MHz)
+    clock = Clock(dut.clk, 40, units="ns")
+    cocotb.start_soon(clock.start())
+
+    dut.ena.value = 1
+    dut.ui_in.value = latency
+    dut.spi_miso.value = 0
+    dut.rst_n.value = 0
+
+    flash = QspiFlash(dut, filename, latency).start()
+    model = VGASource(expected_frames(flash.words(), 2))
+
+    def model_clock():
+        gpio.set(CLK, 1)
+        gpio.set(CLK, 0)
+
+    # The model and the design are both reset for 10 clocks, then compared
+    # after each clock, when the outputs have settled
+    gpio.set(RST_N, 0)
+    for _ in range(10):
+        model_clock()
+    await ClockCycles(dut.clk, 10)
+    dut.rst_n.value = 1
+    gpio.set(RST_N, 1)
+    await FallingEdge(dut.clk)
+
+    for clock in range(526 * 800):
+        expected = sum(gpio.levels[pin] << i for i, pin in enumerate(UO_OUT))
+        actual = int(dut.uo_out.value)
+        assert actual == expected, f"Clock {clock} (line {clock // 800}, {clock % 800}): uo_out {actual:02x}, model {expected:02x}"
+        await FallingEdge(dut.clk)
+        model_clock()
+
+    flash.close()
+    os.remove(filename)
+
+# Time to display one frame, 525 lines of 800 clocks at 40ns
+FRAME_TIME_NS = 525 * 800 * 40
+
+@cocotb.test(skip=not SLOW_TESTS)
+async def test_fuzz(dut):
+    # Random stream near the bandwidth limit from FUZZ_SEED, capturing as many
+    # frames as fit in FUZZ_BUDGET_MS of simulated time, less one for the reset
+    seed = int(os.environ.get("FUZZ_SEED", "1"))
+    budget_ns = float(os.environ.get("FUZZ_BUDGET_MS", "100")) * 1000000
+    frames = max(4, int(budget_ns // FRAME_TIME_NS) - 1)
+    latency, half_rate = random_config(seed)
+
+    # At least two frames in the stream, and few enough that the capture runs
+    # past the end and back to the start, which at 30Hz shows the last frame
+    # once, so the changes between frames and the restart are both covered
+    stream_frames = max(2, frames // 2 if half_rate else frames - 1)
+    dut._log.info(f"Fuzz seed {seed}: {frames} frames of a {stream_frames} frame stream, "
+                  f"latency {latency}, {'30Hz' if half_rate else '60Hz'}")
+
+    fd, filename = tempfile.mkstemp(prefix=f"fuzz{seed}_", suffix=".bin")
+    with os.fdopen(fd, "wb") as f:
+        f.write(pack_words(random_stream(seed, stream_frames)))
+
+    # Set the clock period to 40 ns (25 MHz)
+    clock = Clock(dut.clk, 40, units="ns")
+    cocotb.start_soon(clock.start())
+
+    # Reset
+    dut._log.info("Reset")
+    dut.ena.value = 1
+    dut.ui_in.value = latency + (8 if half_rate else 0)
+    dut.spi_miso.value = 0
+    dut.rst_n.value = 0
+    await ClockCycles(dut.clk, 10)
+    dut.rst_n.value = 1
+
+    flash = QspiFlash(dut, filename, latency).start()
+    expected = expected_frames(flash.words(), frames, half_rate)
+
+    await ClockCycles(dut.hsync, 1)
+
+    for f in range(frames):
+        frame = await capture_frame(dut)
+        diff = np.argwhere(frame != expected[f])
+        if len(diff) != 0:
+            y, x = diff[0]
+            assert False, (f"Seed {seed} frame {f}: {len(diff)} pixels differ, first at ({x}, {y}): "
+                           f"{frame[y, x]} != {expected[f][y, x]}, stream kept in {filename}")
+
+    flash.close()
+    os.remove(filename)
@@ -0,0 +1,86 @@
+# SPDX-FileCopyrightText: © 2024 Michael Bell
+# SPDX-License-Identifier: MIT
+
+# Host tests of the optimal span merge in rle/spans.py, against a brute force
+# search of every way to merge the runs of short random rows.
+#
+#   python3 -m pytest test_spans.py
+
+import os
+import sys
+import random
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from rle.spans import COLOUR_DISTANCE, SPAN_COST, build_spans, merge_optimal
+
+DISTANCE = COLOUR_DISTANCE.tolist()
+
+
+def brute_force(lens, colours, max_span_len):
+    """Least error + SPAN_COST * spans over every valid merge of the runs.
+
+    As in merge_optimal, a span takes no more runs once it is 3 * max_span_len
+    long."""
+    min_triple = 3 * max_span_len
+    n = len(lens)
+    best = None
+
+    # Least error of a span covering runs b to c - 1
+    error = {}
+    for b in range(n):
+        for c in range(b + 1, n + 1):
+            error[b, c] = min(sum(l * DISTANCE[col][colour] for l, col in zip(lens[b:c], colours[b:c]))
+                              for colour in set(colours[b:c]))
+
+    def search(b, spans, cost):
+        nonlocal best
+        if b == n:
+            if best is None or cost < best:
+                best = cost
+            return
+        length = 0
+        for c in range(b + 1, n + 1):
+            length += lens[c - 1]
+            if len(spans) < 2 or spans[-2] + spans[-1] + length >= min_triple:
+                search(c, spans + [length], cost + error[b, c] + SPAN_COST)
+            if length >= min_triple:
+                break
+
+    search(0, [], 0)
+    return best
+
+
+def random_row(rng, width):
+    row = []
+    while len(row) < width:
+        row += [rng.randrange(64)] * rng.choice((1, 2, 2, 3, 4, 6, 10))
+    return row[:width]
+
+
+def merged_cost(lens, colours, merged, max_span_len):
+    """Check merged is a valid merge of the runs, and return its cost"""
+    merged_lens, merged_colours = merged
+    assert sum(merged_lens) == sum(lens)
+    assert all(l >= 2 for l in merged_lens)
+    assert all(sum(merged_lens[i:i + 3]) >= 3 * max_span_len for i in range(len(merged_lens) - 2))
+
+    # Adjacent spans that take the same colour are joined, which only lowers
+    # the cost, so it is at most the brute force optimum
+    shown = [colour for l, colour in zip(merged_lens, merged_colours) for _ in range(l)]
+    source = [colour for l, colour in zip(lens, colours) for _ in range(l)]
+    error = sum(DISTANCE[a][b] for a, b in zip(source, shown))
+    return error + SPAN_COST * len(merged_lens)
+
+
+def test_against_brute_force():
+    rng = random.Random(1)
+    for _ in range(3000):
+        max_span_len = rng.choice((4, 6, 8))
+        lens, colours = build_spans(random_row(rng, rng.randint(20, 70)))
+        # Rows that already meet the constraint are left alone
+        if not 3 < len(lens) <= 13 or all(sum(lens[i:i + 3]) >= 3 * max_span_len for i in range(len(lens) - 2)):
+            continue
+        expected = brute_force(lens, colours, max_span_len)
+        merged = merge_optimal((list(lens), list(colours)), max_span_len)
+        assert merged_cost(lens, colours, merged, max_span_len) <= expected, (lens, colours, max_span_len)
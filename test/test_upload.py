@@ -0,0 +1,198 @@
+# SPDX-FileCopyrightText: © 2024 Michael Bell
+# SPDX-License-Identifier: MIT
+
+# Host tests of the framed USB upload: rle/upload.py sending to the device's
+# micropython/usb_transfer.py, running on a thread with the emulated
+# micropython module, joined by in-memory pipes in place of the serial link.
+#
+#   python3 -m pytest test_upload.py
+
+import os
+import sys
+import time
+import zlib
+import random
+import struct
+import threading
+import types
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(ROOT, "micropython", "emu"))
+sys.path.insert(0, ROOT)
+
+import board
+board.install()
+
+import usb_transfer
+from rle import upload
+
+
+class Pipe:
+    """One direction of the link, read with a timeout like pyserial"""
+
+    def __init__(self):
+        self.data = bytearray()
+        self.cv = threading.Condition()
+
+    def write(self, b):
+        with self.cv:
+            self.data += bytes(b)
+            self.cv.notify_all()
+        return len(b)
+
+    def readinto(self, mv):
+        with self.cv:
+            while not self.data:
+                self.cv.wait()
+            n = min(len(mv), len(self.data))
+            mv[:n] = self.data[:n]
+            del self.data[:n]
+            return n
+
+    def read(self, n, timeout):
+        deadline = time.monotonic() + timeout
+        with self.cv:
+            while len(self.data) < n and self.cv.wait(deadline - time.monotonic()):
+                pass
+            out = bytes(self.data[:n])
+            del self.data[:n]
+            return out
+
+
+class Link:
+    """The host's end of the link, with a hook to damage frames on the way"""
+
+    def __init__(self, to_device, from_device, damage=None):
+        self.to_device = to_device
+        self.from_device = from_device
+        self.damage = damage
+        self.timeout = 1
+        self.frames = []
+
+    def write(self, b):
+        self.frames.append(bytes(b))
+        if self.damage is not None:
+            b = self.damage(len(self.frames) - 1, bytearray(b))
+        return self.to_device.write(b)
+
+    def read(self, n):
+        return self.from_device.read(n, self.timeout)
+
+
+class Replies:
+    """The device's end of the link, sending a stale ack again before V"""
+
+    def __init__(self, pipe):
+        self.pipe = pipe
+        self.last = None
+
+    def write(self, b):
+        b = bytes(b)
+        if b[:1] == b"V":
+            self.pipe.write(self.last)
+        elif b[:1] == b"A":
+            self.last = b
+        return self.pipe.write(b)
+
+
+def run_upload(monkeypatch, data, damage=None, window=8, stale_ack=False, stored=None):
+    to_device = Pipe()
+    from_device = Pipe()
+    received = bytearray()
+
+    def sink(offset, chunk):
+        assert offset == len(received)
+        received.extend(chunk)
+
+    def readback(length):
+        return zlib.crc32(received[:length] if stored is None else stored)
+
+    monkeypatch.setattr(sys, "stdin", types.SimpleNamespace(buffer=to_device))
+    monkeypatch.setattr(sys, "stdout", types.SimpleNamespace(buffer=Replies(from_device) if stale_ack else from_device))
+    device = threading.Thread(target=usb_transfer.receive, args=(sink, None, readback), daemon=True)
+    device.start()
+    assert from_device.read(4, 5) == b"RDY\n"
+    monkeypatch.undo()
+
+    link = Link(to_device, from_device, damage)
+    crc, link.stored, _ = upload.upload(types.SimpleNamespace(serial=link), data, window)
+    device.join(5)
+    assert not device.is_alive()
+    assert crc == zlib.crc32(data)
+    assert bytes(received) == data
+    return link
+
+
+def sends(link, seq):
+    # Times the frame with seq was sent
+    return sum(1 for f in link.frames if struct.unpack_from("<H", f, 3)[0] == seq)
+
+
+def test_clean(monkeypatch):
+    data = random.Random(1).randbytes(50_000)
+    link = run_upload(monkeypatch, data)
+    assert len(link.frames) == 2 + (len(data) + upload.CHUNK - 1) // upload.CHUNK
+
+
+def test_corrupted_frame(monkeypatch):
+    data = random.Random(2).randbytes(50_000)
+
+    def damage(i, b):
+        if i == 4:
+            b[100] ^= 0xff
+        return b
+
+    link = run_upload(monkeypatch, data, damage)
+    assert sends(link, 4) == 2
+
+
+def test_false_magic(monkeypatch):
+    # A frame whose length is damaged is resynced inside its own payload, where
+    # a MAGIC and header draw a second N for the same frame, which must not
+    # send the window again
+    data = bytearray(random.Random(3).randbytes(50_000))
+    fake = upload.frame(b"D", 9, bytes(16))
+    fake = fake[:-1] + bytes((fake[-1] ^ 1,))
+    offset = 3 * upload.CHUNK + 200
+    data[offset:offset + len(fake)] = fake
+    data = bytes(data)
+
+    def damage(i, b):
+        if i == 4 and len(b) > 100:
+            b[5:7] = struct.pack("<H", 32)
+        return b
+
+    link = run_upload(monkeypatch, data, damage)
+    assert sends(link, 4) == 2
+
+
+def test_stale_acks(monkeypatch):
+    # Frames sent twice are acked again, and those acks can still be queued
+    # when the last frame is acked
+    data = random.Random(4).randbytes(10_000)
+    run_upload(monkeypatch, data, stale_ack=True)
+
+
+def test_readback(monkeypatch):
+    # The CRC of the data read back from the flash is returned separately, so
+    # a failed program shows even though the transfer was good
+    data = random.Random(5).randbytes(10_000)
+    link = run_upload(monkeypatch, data)
+    assert link.stored == zlib.crc32(data)
+    link = run_upload(monkeypatch, data, stored=data[:-1] + b"\xff")
+    assert link.stored != zlib.crc32(data)
+
+
+def test_board_error(monkeypatch):
+    # An unexpected error from one board is its result, not raised
+    class BadRepl:
+        def __init__(self, port):
+            self.serial = types.SimpleNamespace(close=lambda: None)
+
+        def start(self, code):
+            raise ValueError("bad reply")
+
+    monkeypatch.setattr(upload, "RawRepl", BadRepl)
+    result = upload.program_board("/dev/ttyACM9", b"data")
+    assert not result["ok"]
+    assert result["error"] == "ValueError: bad reply"